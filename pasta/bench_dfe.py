@@ -0,0 +1,626 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark offline do robô (dfe.py), sem tocar nos serviços reais.
+
+Sobe, num processo separado, três serviços locais no lugar dos reais:
+  - portal SEFIN (HTTPS com mTLS; a empresa é identificada pelo CN do certificado do cliente)
+      /solicitacoes, /solicitacoes/novo, /solicitacoes/create,
+      /solicitacoes/detalhes/{id}, /solicitacoes/get_captcha_download/{id}, download do ZIP
+      (aceita Range; com --queda-download corta parte das transferências no meio)
+  - Anti-Captcha: createTask / getTaskResult com latência configurável
+  - Supabase: REST da certifica_dfe, LIST do storage (paginado), upload, cópia e GET de objeto
+
+Depois roda processar_todas_empresas() com N empresas sintéticas e mostra, por varredura:
+tempo total, requisições por empresa, pico de RSS do processo do robô e latência por etapa.
+
+Uso:
+    python bench_dfe.py --empresas 50 --varreduras 3 --latencia-captcha 2 --latencia-portal 0.05
+    python bench_dfe.py --empresas 20 --json bench.json
+    python bench_dfe.py --empresas 20 --gravar-http /tmp/dfe_http.sqlite3
+    DFE_HTTP_MODO=reproduzir DFE_HTTP_ARQUIVO=/tmp/dfe_http.sqlite3 python dfe.py varredura --vezes 3
+
+Precisa do executável 'openssl' (gera a CA e os certificados de cliente do teste).
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+PNG_FALSO = base64.b64encode(b"\x89PNG\r\n\x1a\n bench").decode()
+TIPOS_POR_CODIGO = {"0": "NFe", "1": "CTe", "2": "NFCe"}
+
+
+# =========================================================
+# CERTIFICADOS DO TESTE (openssl)
+# =========================================================
+def _openssl(*args: str):
+    subprocess.run(["openssl", *args], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def gerar_pki(pasta: str, n_empresas: int) -> Dict[str, Any]:
+    """
+    CA + certificado do servidor (127.0.0.1) + um certificado de cliente por empresa (CN = codi).
+    Chaves EC para a geração ser rápida mesmo com centenas de empresas.
+    """
+    curva = ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes"]
+    ca_pem, ca_key = os.path.join(pasta, "ca.pem"), os.path.join(pasta, "ca.key")
+    _openssl("req", "-x509", *curva, "-keyout", ca_key, "-out", ca_pem, "-days", "2", "-subj", "/CN=bench-ca")
+
+    def assinar(nome: str, cn: str, extfile: Optional[str] = None):
+        key, csr, pem = (os.path.join(pasta, f"{nome}.{ext}") for ext in ("key", "csr", "pem"))
+        _openssl("req", "-new", *curva, "-keyout", key, "-out", csr, "-subj", f"/CN={cn}")
+        extra = ["-extfile", extfile] if extfile else []
+        _openssl("x509", "-req", "-in", csr, "-CA", ca_pem, "-CAkey", ca_key,
+                 "-set_serial", str(random.getrandbits(63)), "-out", pem, "-days", "2", *extra)
+        return pem, key
+
+    san = os.path.join(pasta, "san.ext")
+    with open(san, "w") as f:
+        f.write("subjectAltName=IP:127.0.0.1,DNS:localhost\n")
+    srv_pem, srv_key = assinar("servidor", "localhost", san)
+
+    clientes = []
+    for i in range(n_empresas):
+        pem, key = assinar(f"empresa{i}", str(i))
+        with open(pem, "rb") as fp, open(key, "rb") as fk:
+            clientes.append((base64.b64encode(fp.read()).decode(), base64.b64encode(fk.read()).decode()))
+
+    return {"ca": ca_pem, "servidor": (srv_pem, srv_key), "clientes": clientes}
+
+
+# =========================================================
+# SERVIÇOS LOCAIS (rodam no processo filho)
+# =========================================================
+class Contadores:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.dados: Dict[str, Any] = {}
+
+    def inc(self, chave: str, n: int = 1):
+        with self._lock:
+            self.dados[chave] = self.dados.get(chave, 0) + n
+
+    def copia(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.dados)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def responder(self, status: int, corpo: Any = b"", content_type: str = "text/html; charset=utf-8",
+                  extra: Optional[Dict[str, str]] = None):
+        if isinstance(corpo, str):
+            corpo = corpo.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(corpo)))
+        for k, v in (extra or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def json(self, obj: Any, status: int = 200):
+        self.responder(status, json.dumps(obj), "application/json")
+
+    def corpo(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+
+class ServidorTLS(ThreadingHTTPServer):
+    """
+    Handshake TLS na thread de cada conexão (não trava o accept).
+    """
+    daemon_threads = True
+
+    def __init__(self, endereco, handler, ctx: ssl.SSLContext):
+        super().__init__(endereco, handler)
+        self.ctx = ctx
+
+    def finish_request(self, request, client_address):
+        request = self.ctx.wrap_socket(request, server_side=True)
+        super().finish_request(request, client_address)
+
+
+def _criar_portal(cfg: Dict[str, Any], cont: Contadores):
+    lock = threading.Lock()
+    estado: Dict[str, Any] = {"proximo_id": 1000, "empresas": {}}
+    zips: Dict[str, Tuple[bytes, str]] = {}
+
+    def zip_da_solicitacao(emp: str, x: Dict[str, Any]) -> Tuple[bytes, str]:
+        # mesmo conteúdo para a mesma empresa+tipo+período (solicitação reaberta = bytes iguais)
+        chave = f"{emp}|{x['tipo']}|{x['periodo']}"
+        with lock:
+            if chave not in zips:
+                dados = _zip_sintetico(cfg["zip_kb"], chave)
+                zips[chave] = (dados, '"' + hashlib.sha256(dados).hexdigest()[:16] + '"')
+            return zips[chave]
+
+    class Portal(_Handler):
+        def empresa(self) -> str:
+            cert = self.connection.getpeercert() or {}
+            return dict(x[0] for x in cert.get("subject", ())).get("commonName", "?")
+
+        def solicitacoes(self, emp: str) -> List[Dict[str, Any]]:
+            with lock:
+                lista = estado["empresas"].setdefault(emp, [])
+                for x in lista:
+                    if x["estado"] == "GERANDO" and time.time() - x["criada"] >= cfg["geracao"]:
+                        x["estado"] = "DOWNLOAD"
+                return list(lista)
+
+        def contar(self, emp: str, rota: str):
+            cont.inc(f"portal.{rota}")
+            cont.inc(f"portal_empresa.{emp}")
+            if cfg["latencia_portal"]:
+                time.sleep(cfg["latencia_portal"])
+
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            if path == "/__bench/stats":
+                return self.json(cont.copia())
+
+            emp = self.empresa()
+            sols = self.solicitacoes(emp)
+
+            if path == "/solicitacoes":
+                self.contar(emp, "listagem")
+                linhas = "".join(
+                    f'<tr><td>{time.strftime("%d/%m/%Y %H:%M", time.localtime(x["criada"]))}</td><td>{x["tipo"]}</td><td>{x["estado"]}</td>'
+                    f'<td><a href="/solicitacoes/detalhes/{x["id"]}">Detalhes</a></td></tr>'
+                    for x in reversed(sols)
+                )
+                return self.responder(200, (
+                    '<html><body><table class="table table-hover"><thead><tr><th>Data</th><th>Documento</th>'
+                    f'<th>Estado</th><th>Ações</th></tr></thead><tbody>{linhas}</tbody></table></body></html>'
+                ))
+
+            m = re.match(r"^/solicitacoes/detalhes/(\d+)$", path)
+            if m:
+                self.contar(emp, "detalhes")
+                x = next((x for x in sols if x["id"] == int(m.group(1))), None)
+                if not x:
+                    return self.responder(404)
+                link = (f'<a class="link-detalhe" href="/solicitacoes/get_captcha_download/{x["id"]}">Arquivo</a>'
+                        if x["estado"] == "DOWNLOAD" else "")
+                return self.responder(200, (
+                    '<html><body><table class="table table-xxs">'
+                    f'<tr><td>Período</td><td>{x["periodo"]}</td></tr>'
+                    f'<tr><td>CNPJ/CPF</td><td>{x["doc"]}</td></tr></table>{link}</body></html>'
+                ))
+
+            m = re.match(r"^/solicitacoes/get_captcha_download/(\d+)$", path)
+            if m:
+                self.contar(emp, "modal")
+                form = (f'<form action="/solicitacoes/download/{m.group(1)}"><input name="token" value="t{m.group(1)}">'
+                        f'<img src="data:image/png;base64,{PNG_FALSO}"></form>')
+                return self.responder(200, '$("#bloco_modal").html("' + form.replace('"', '\\"') + '");',
+                                      "text/javascript; charset=utf-8")
+
+            m = re.match(r"^/solicitacoes/download/(\d+)$", path)
+            if m:
+                self.contar(emp, "download")
+                x = next((x for x in sols if x["id"] == int(m.group(1))), None)
+                if not x:
+                    return self.responder(404)
+                zip_bytes, etag_zip = zip_da_solicitacao(emp, x)
+                extra = {"ETag": etag_zip, "Accept-Ranges": "bytes"}
+                inicio = 0
+                m_range = re.match(r"^bytes=(\d+)-$", self.headers.get("Range") or "")
+                if m_range and self.headers.get("If-Range") in (None, etag_zip):
+                    inicio = int(m_range.group(1))
+                    if inicio >= len(zip_bytes):
+                        return self.responder(416, b"", "text/plain", {"Content-Range": f"bytes */{len(zip_bytes)}"})
+                    extra["Content-Range"] = f"bytes {inicio}-{len(zip_bytes) - 1}/{len(zip_bytes)}"
+                    cont.inc("portal.download_retomado")
+                corpo = zip_bytes[inicio:]
+                if random.random() < cfg["queda_download"]:
+                    # manda os cabeçalhos completos e derruba a conexão no meio do corpo
+                    cont.inc("portal.download_cortado")
+                    cont.inc("portal.bytes_download", len(corpo) // 2)
+                    self.send_response(206 if inicio else 200)
+                    self.send_header("Content-Type", "application/zip")
+                    self.send_header("Content-Length", str(len(corpo)))
+                    for k, v in extra.items():
+                        self.send_header(k, v)
+                    self.end_headers()
+                    self.wfile.write(corpo[:len(corpo) // 2])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return None
+                cont.inc("portal.bytes_download", len(corpo))
+                return self.responder(206 if inicio else 200, corpo, "application/zip", extra)
+
+            if path == "/solicitacoes/novo":
+                self.contar(emp, "novo")
+                doc = f"{int(emp):014d}" if emp.isdigit() else "0"
+                return self.responder(200, (
+                    '<html><head><meta name="csrf-token" content="csrf"></head><body>'
+                    '<form id="frm_solicitacao" action="/solicitacoes/create">'
+                    f'<input name="token" value="t"><input name="id_pessoa" value="{doc}">'
+                    f'<img src="data:image/png;base64,{PNG_FALSO}"></form></body></html>'
+                ))
+
+            self.responder(404)
+
+        def do_POST(self):
+            emp = self.empresa()
+            dados = parse_qs(self.corpo().decode())
+            if urlsplit(self.path).path == "/solicitacoes/create":
+                self.contar(emp, "create")
+                with lock:
+                    estado["proximo_id"] += 1
+                    estado["empresas"].setdefault(emp, []).append({
+                        "id": estado["proximo_id"],
+                        "tipo": TIPOS_POR_CODIGO.get((dados.get("dfe_documento") or ["0"])[0], "NFe"),
+                        "doc": (dados.get("id_pessoa") or [""])[0],
+                        "estado": "GERANDO",
+                        "periodo": "{} a {}".format((dados.get("periodo_inicial") or [""])[0],
+                                                    (dados.get("periodo_final") or [""])[0]),
+                        "criada": time.time(),
+                    })
+                return self.responder(302, extra={"Location": "/solicitacoes"})
+            self.responder(404)
+
+    return Portal
+
+
+def _criar_anticaptcha(cfg: Dict[str, Any], cont: Contadores):
+    lock = threading.Lock()
+    tarefas: Dict[int, float] = {}
+
+    class AntiCaptcha(_Handler):
+        def do_GET(self):
+            if self.path == "/__bench/stats":
+                return self.json(cont.copia())
+            self.responder(404)
+
+        def do_POST(self):
+            corpo = json.loads(self.corpo() or b"{}")
+            if self.path.endswith("/createTask"):
+                cont.inc("anticaptcha.createTask")
+                lat = max(0.0, random.gauss(cfg["latencia_captcha"], cfg["latencia_captcha"] * 0.25))
+                with lock:
+                    task_id = len(tarefas) + 1
+                    tarefas[task_id] = time.time() + lat
+                return self.json({"errorId": 0, "taskId": task_id})
+            if self.path.endswith("/getTaskResult"):
+                cont.inc("anticaptcha.getTaskResult")
+                pronto = time.time() >= tarefas.get(corpo.get("taskId"), 0)
+                return self.json({"errorId": 0, "status": "ready", "solution": {"text": "bench"}}
+                                 if pronto else {"errorId": 0, "status": "processing"})
+            self.responder(404)
+
+    return AntiCaptcha
+
+
+def _criar_supabase(cfg: Dict[str, Any], cont: Contadores):
+    lock = threading.Lock()
+    objetos: Dict[str, int] = {}
+    conteudos: Dict[str, bytes] = {}  # só os JSON pequenos (sidecars), para o GET
+    certs: List[Dict[str, Any]] = cfg["certs"]
+
+    class Supabase(_Handler):
+        def do_GET(self):
+            u = urlsplit(self.path)
+            if u.path == "/__bench/stats":
+                return self.json(cont.copia())
+            if u.path.startswith("/rest/v1/"):
+                cont.inc("supabase.rest")
+                q = parse_qs(u.query)
+                linhas = certs
+                if "id" in q:
+                    linhas = [c for c in certs if f"eq.{c['id']}" == q["id"][0]]
+                colunas = [c.strip().strip('"') for c in (q.get("select") or ["*"])[0].split(",")]
+                if colunas != ["*"]:
+                    linhas = [{k: c.get(k) for k in colunas} for c in linhas]
+                corpo = json.dumps(linhas)
+                cont.inc("supabase.bytes_rest", len(corpo))
+                return self.responder(200, corpo, "application/json")
+            m = re.match(r"^/storage/v1/object/[^/]+/(.+)$", u.path)
+            if m:
+                cont.inc("supabase.get")
+                with lock:
+                    dados = conteudos.get(m.group(1))
+                if dados is None:
+                    return self.json({"statusCode": "404", "error": "not_found"}, 400)
+                return self.responder(200, dados, "application/octet-stream")
+            self.responder(404)
+
+        def do_POST(self):
+            path = urlsplit(self.path).path
+            corpo = self.corpo()
+            if path.startswith("/storage/v1/object/list/"):
+                cont.inc("supabase.list")
+                b = json.loads(corpo)
+                prefixo = b.get("prefix", "").strip("/") + "/"
+                with lock:
+                    nomes = sorted(k[len(prefixo):] for k in objetos
+                                   if k.startswith(prefixo) and (b.get("search") or "") in k[len(prefixo):])
+                pagina = nomes[b.get("offset", 0): b.get("offset", 0) + b.get("limit", 100)]
+                return self.json([{"name": n} for n in pagina])
+            if path == "/storage/v1/object/copy":
+                cont.inc("supabase.copy")
+                b = json.loads(corpo)
+                with lock:
+                    if b["sourceKey"] not in objetos:
+                        return self.json({"statusCode": "404", "error": "not_found"}, 400)
+                    objetos[b["destinationKey"]] = objetos[b["sourceKey"]]
+                return self.json({"Key": b["destinationKey"]})
+            m = re.match(r"^/storage/v1/object/[^/]+/(.+)$", path)
+            if m:
+                cont.inc("supabase.upload")
+                cont.inc("supabase.bytes_upload", len(corpo))
+                with lock:
+                    objetos[m.group(1)] = len(corpo)
+                    if m.group(1).endswith(".json"):
+                        conteudos[m.group(1)] = corpo
+                return self.json({"Key": m.group(1)})
+            self.responder(404)
+
+    return Supabase
+
+
+def _zip_sintetico(kb: int, semente: str) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as z:
+        z.writestr("nfe.xml", random.Random(semente).randbytes(max(1, kb) * 1024))
+    return buf.getvalue()
+
+
+def _rodar_servicos(cfg: Dict[str, Any], fila):
+    cont = Contadores()
+
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(*cfg["pki"]["servidor"])
+    ctx.load_verify_locations(cfg["pki"]["ca"])
+    ctx.verify_mode = ssl.CERT_REQUIRED
+
+    servidores = [
+        ServidorTLS(("127.0.0.1", 0), _criar_portal(cfg, cont), ctx),
+        ThreadingHTTPServer(("127.0.0.1", 0), _criar_anticaptcha(cfg, cont)),
+        ThreadingHTTPServer(("127.0.0.1", 0), _criar_supabase(cfg, cont)),
+    ]
+    for srv in servidores:
+        srv.daemon_threads = True
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+
+    portal, anti, supa = (srv.server_address[1] for srv in servidores)
+    fila.put({
+        "portal": f"https://127.0.0.1:{portal}",
+        "anticaptcha": f"http://127.0.0.1:{anti}",
+        "supabase": f"http://127.0.0.1:{supa}",
+    })
+    threading.Event().wait()
+
+
+# =========================================================
+# LADO DO ROBÔ
+# =========================================================
+def apontar_dfe(dfe, urls: Dict[str, str], dir_cache: str):
+    """
+    Aponta o módulo dfe para os serviços locais e para um cache/ledger temporários.
+    """
+    p = urls["portal"]
+    dfe.URL_BASE = p
+    dfe.URL_CREATE_BASE = p
+    dfe.URL_NOVO = p + "/solicitacoes/novo"
+    dfe.URL_SOLICITACOES = p + "/solicitacoes"
+    dfe.URL_DETALHES_TEMPLATE = p + "/solicitacoes/detalhes/{id}"
+    dfe.URL_ANTI_CREATE = urls["anticaptcha"] + "/createTask"
+    dfe.URL_ANTI_RESULT = urls["anticaptcha"] + "/getTaskResult"
+    dfe.SUPABASE_URL = urls["supabase"]
+    dfe.DIR_CACHE = dir_cache
+    dfe.CAPTCHA_MODELO = os.path.join(dir_cache, "captcha_modelo.json")  # sem modelo: tudo vai ao Anti-Captcha
+    dfe.ANTI_CAPTCHA_KEY = dfe.ANTI_CAPTCHA_KEY or "bench"
+    dfe.configurar_log()  # no stdout da hora: com redirect_stdout o log some (sem --verbose)
+
+
+class Etapas:
+    """
+    Latência por etapa medindo as funções do dfe que correspondem a cada etapa.
+    """
+    FUNCOES = {
+        "certificados": "carregar_certificados_validos",
+        "listagem": "listar_solicitacoes",
+        "detalhes": "extrair_detalhes_solicitacao",
+        "solicitacao": "concluir_solicitacao",
+        "download+upload": "concluir_download_dfe",
+        "upload": "upload_para_storage",
+    }
+
+    def __init__(self, dfe):
+        self._lock = threading.Lock()
+        self.amostras: Dict[str, List[float]] = {k: [] for k in list(self.FUNCOES) + ["sessao", "captcha"]}
+        for etapa, nome in self.FUNCOES.items():
+            setattr(dfe, nome, self._medir(etapa, getattr(dfe, nome)))
+        dfe.POOL_SESSOES.obter = self._medir("sessao", dfe.POOL_SESSOES.obter)
+        dfe.resolver_captcha_async = self._medir_future("captcha", dfe.resolver_captcha_async)
+
+    def _medir(self, etapa: str, func: Callable) -> Callable:
+        def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.amostras[etapa].append(time.perf_counter() - inicio)
+        return medida
+
+    def _medir_future(self, etapa: str, func: Callable) -> Callable:
+        """
+        Para funções que devolvem Future: mede até o resultado ficar pronto.
+        """
+        def medida(*args, **kwargs):
+            inicio = time.perf_counter()
+            fut = func(*args, **kwargs)
+
+            def registrar(_f):
+                with self._lock:
+                    self.amostras[etapa].append(time.perf_counter() - inicio)
+            fut.add_done_callback(registrar)
+            return fut
+        return medida
+
+    def resumo_e_zera(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            amostras, self.amostras = self.amostras, {k: [] for k in self.amostras}
+        return {k: _percentis(v) for k, v in amostras.items() if v}
+
+
+def _percentis(valores: List[float]) -> Dict[str, float]:
+    v = sorted(valores)
+    def p(q: float) -> float:
+        return v[min(len(v) - 1, int(round(q * (len(v) - 1))))]
+    return {"n": len(v), "p50": p(0.5), "p95": p(0.95), "max": v[-1], "total": sum(v)}
+
+
+def _delta(depois: Dict[str, Any], antes: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v - antes.get(k, 0) for k, v in depois.items() if v - antes.get(k, 0)}
+
+
+def rodar_benchmark(args) -> Dict[str, Any]:
+    pasta = tempfile.mkdtemp(prefix="bench_dfe_")
+    print(f"🔐 Gerando certificados de teste para {args.empresas} empresas...")
+    pki = gerar_pki(pasta, args.empresas)
+    os.environ["REQUESTS_CA_BUNDLE"] = pki["ca"]
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import dfe
+
+    certs = [{
+        "id": i,
+        "pem": pem,
+        "key": key,
+        "empresa": f"Empresa Bench {i}",
+        "codi": i,
+        "user": f"bench{i}@exemplo.com",
+        "vencimento": "2099-12-31",
+        "cnpj/cpf": f"{i:014d}",
+        "fazer": "sim",
+    } for i, (pem, key) in enumerate(pki["clientes"])]
+
+    cfg = {
+        "pki": pki,
+        "certs": certs,
+        "geracao": args.geracao,
+        "latencia_portal": args.latencia_portal,
+        "latencia_captcha": args.latencia_captcha,
+        "zip_kb": args.zip_kb,
+        "queda_download": args.queda_download,
+    }
+    fila: Any = multiprocessing.Queue()
+    servicos = multiprocessing.Process(target=_rodar_servicos, args=(cfg, fila), daemon=True)
+    servicos.start()
+    urls = fila.get(timeout=30)
+
+    apontar_dfe(dfe, urls, os.path.join(pasta, "cache"))
+    if args.workers:
+        dfe.MAX_WORKERS_EMPRESAS = args.workers
+    if args.gravar_http:
+        dfe.MODO_HTTP = "gravar"
+        dfe.ARQUIVO_HTTP = args.gravar_http
+    etapas = Etapas(dfe)
+
+    def stats() -> Dict[str, Any]:
+        import requests
+        dados: Dict[str, Any] = {}
+        for nome, url in urls.items():
+            verify = pki["ca"] if url.startswith("https") else True
+            # o portal exige certificado de cliente; qualquer um da CA serve para ler as estatísticas
+            cert = (os.path.join(pasta, "empresa0.pem"), os.path.join(pasta, "empresa0.key")) if nome == "portal" else None
+            dados.update(requests.get(url + "/__bench/stats", verify=verify, cert=cert, timeout=10).json())
+        return dados
+
+    resultado: Dict[str, Any] = {"config": {k: v for k, v in vars(args).items()}, "varreduras": []}
+    antes = stats()
+    try:
+        for i in range(args.varreduras):
+            if i and args.pausa:
+                time.sleep(args.pausa)
+            inicio = time.perf_counter()
+            saida = sys.stdout if args.verbose else io.StringIO()
+            with redirect_stdout(saida):
+                dfe.processar_todas_empresas()
+            duracao = time.perf_counter() - inicio
+
+            depois = stats()
+            delta = _delta(depois, antes)
+            antes = depois
+            req_portal = sum(v for k, v in delta.items() if k.startswith("portal_empresa."))
+            varredura = {
+                "varredura": i + 1,
+                "segundos": duracao,
+                "req_portal_por_empresa": req_portal / args.empresas,
+                "req_anticaptcha_por_empresa": (delta.get("anticaptcha.createTask", 0)
+                                               + delta.get("anticaptcha.getTaskResult", 0)) / args.empresas,
+                "req_supabase_por_empresa": (delta.get("supabase.rest", 0) + delta.get("supabase.list", 0)
+                                            + delta.get("supabase.upload", 0)) / args.empresas,
+                "contadores": {k: v for k, v in delta.items() if not k.startswith("portal_empresa.")},
+                "pico_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                "etapas": etapas.resumo_e_zera(),
+            }
+            resultado["varreduras"].append(varredura)
+            imprimir_varredura(varredura)
+    finally:
+        servicos.terminate()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resultado salvo em {args.json}")
+    return resultado
+
+
+def imprimir_varredura(v: Dict[str, Any]):
+    print(f"\n=== Varredura {v['varredura']}: {v['segundos']:.2f}s | pico RSS {v['pico_rss_mb']:.0f} MB ===")
+    print(f"   req/empresa  portal: {v['req_portal_por_empresa']:.1f}"
+          f" | anti-captcha: {v['req_anticaptcha_por_empresa']:.1f}"
+          f" | supabase: {v['req_supabase_por_empresa']:.1f}")
+    print(f"   contadores: {json.dumps(v['contadores'], ensure_ascii=False)}")
+    print(f"   {'etapa':<16}{'n':>6}{'p50 (s)':>10}{'p95 (s)':>10}{'max (s)':>10}")
+    for etapa, e in v["etapas"].items():
+        print(f"   {etapa:<16}{e['n']:>6}{e['p50']:>10.3f}{e['p95']:>10.3f}{e['max']:>10.3f}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark offline do robô DFe com serviços locais.")
+    parser.add_argument("--empresas", type=int, default=20, help="quantidade de empresas sintéticas")
+    parser.add_argument("--varreduras", type=int, default=3, help="quantas varreduras seguidas")
+    parser.add_argument("--pausa", type=float, default=0.0, help="segundos entre varreduras")
+    parser.add_argument("--workers", type=int, default=0, help="MAX_WORKERS_EMPRESAS (0 = padrão do dfe)")
+    parser.add_argument("--geracao", type=float, default=0.0,
+                        help="segundos até uma solicitação sair de GERANDO para DOWNLOAD")
+    parser.add_argument("--latencia-portal", type=float, default=0.02, help="latência por requisição ao portal (s)")
+    parser.add_argument("--latencia-captcha", type=float, default=2.0, help="tempo médio de resolução do captcha (s)")
+    parser.add_argument("--zip-kb", type=int, default=256, help="tamanho do ZIP servido no download (KB)")
+    parser.add_argument("--queda-download", type=float, default=0.0,
+                        help="fração dos downloads cortados no meio (testa a retomada com Range)")
+    parser.add_argument("--gravar-http", metavar="ARQUIVO",
+                        help="grava as trocas HTTP (para reproduzir com DFE_HTTP_MODO=reproduzir dfe.py varredura)")
+    parser.add_argument("--json", help="salva o resultado completo neste arquivo")
+    parser.add_argument("--verbose", action="store_true", help="mostra o log do robô")
+    rodar_benchmark(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
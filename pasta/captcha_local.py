@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+"""
+Captcha local (CPU) do portal SEFIN-RO, com reserva num resolvedor externo (Anti-Captcha).
+
+As imagens vêm sempre do mesmo gerador do portal (fundo claro, caracteres escuros
+separados). O reconhecedor segmenta os caracteres e compara cada um, por vizinho mais
+próximo, com bitmaps tirados de captchas que o portal já aceitou (dataset capturado).
+Só a biblioteca padrão: o PNG é decodificado com zlib.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+log = logging.getLogger("dfe.captcha")
+
+
+class ResolvedorCaptcha(ABC):
+    """
+    Interface dos resolvedores de captcha: resolver(b64 do PNG) devolve um Future com o
+    texto, ou None se não conseguiu (o chamador cai no modo manual / nova tentativa).
+    """
+
+    @abstractmethod
+    def resolver(self, b64_image_content: str) -> "Future[Optional[str]]":
+        ...
+
+
+class _SemMetricas:
+    # ResolvedorLocal sem coletor de métricas (testes, uso avulso)
+    def medir(self, _etapa: str):
+        return nullcontext()
+
+    def incrementar(self, _nome: str, _valor: float = 1):
+        pass
+
+
+# =========================================================
+# PNG -> TONS DE CINZA
+# =========================================================
+_ASSINATURA_PNG = b"\x89PNG\r\n\x1a\n"
+
+
+def _desfiltrar_linha(filtro: int, linha: bytearray, anterior: bytearray, bpp: int):
+    n = len(linha)
+    if filtro == 0:
+        return
+    if filtro == 1:
+        for x in range(bpp, n):
+            linha[x] = (linha[x] + linha[x - bpp]) & 0xFF
+    elif filtro == 2:
+        for x in range(n):
+            linha[x] = (linha[x] + anterior[x]) & 0xFF
+    elif filtro == 3:
+        for x in range(n):
+            a = linha[x - bpp] if x >= bpp else 0
+            linha[x] = (linha[x] + ((a + anterior[x]) >> 1)) & 0xFF
+    elif filtro == 4:
+        for x in range(n):
+            a = linha[x - bpp] if x >= bpp else 0
+            b = anterior[x]
+            c = anterior[x - bpp] if x >= bpp else 0
+            p = a + b - c
+            pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+            linha[x] = (linha[x] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+    else:
+        raise ValueError(f"filtro PNG inválido: {filtro}")
+
+
+def decodificar_png(dados: bytes) -> Tuple[int, int, bytearray]:
+    """
+    Decodifica um PNG não entrelaçado (até 8 bits por canal) em tons de cinza 0-255.
+    Transparência é composta sobre fundo branco. Retorna (largura, altura, pixels).
+    """
+    if not dados.startswith(_ASSINATURA_PNG):
+        raise ValueError("imagem não é PNG")
+    pos = len(_ASSINATURA_PNG)
+    ihdr = None
+    paleta = b""
+    idat: List[bytes] = []
+    while pos + 8 <= len(dados):
+        n, tipo = struct.unpack(">I4s", dados[pos:pos + 8])
+        corpo = dados[pos + 8:pos + 8 + n]
+        pos += 12 + n
+        if tipo == b"IHDR":
+            ihdr = struct.unpack(">IIBBBBB", corpo)
+        elif tipo == b"PLTE":
+            paleta = corpo
+        elif tipo == b"IDAT":
+            idat.append(corpo)
+        elif tipo == b"IEND":
+            break
+    if ihdr is None:
+        raise ValueError("PNG sem IHDR")
+
+    largura, altura, bits, cor, _compressao, _filtro, entrelacado = ihdr
+    canais = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}.get(cor)
+    if canais is None or entrelacado or bits > 8 or (bits < 8 and cor not in (0, 3)):
+        raise ValueError(f"PNG não suportado (cor={cor}, bits={bits}, entrelaçado={entrelacado})")
+
+    bruto = zlib.decompress(b"".join(idat))
+    passo = (largura * canais * bits + 7) // 8
+    bpp = max(1, canais * bits // 8)
+    por_byte = 8 // bits
+    mascara = (1 << bits) - 1
+    cinza = bytearray(largura * altura)
+    anterior = bytearray(passo)
+    i = 0
+    for y in range(altura):
+        linha = bytearray(bruto[i + 1:i + 1 + passo])
+        _desfiltrar_linha(bruto[i], linha, anterior, bpp)
+        i += 1 + passo
+        anterior = linha
+
+        base = y * largura
+        if bits < 8:
+            for x in range(largura):
+                v = (linha[x // por_byte] >> (8 - bits * (x % por_byte + 1))) & mascara
+                if cor == 3:
+                    r, g, b = paleta[3 * v:3 * v + 3]
+                    cinza[base + x] = (r * 299 + g * 587 + b * 114) // 1000
+                else:
+                    cinza[base + x] = v * 255 // mascara
+            continue
+        for x in range(largura):
+            k = x * canais
+            if cor == 0:
+                v = linha[k]
+            elif cor == 3:
+                r, g, b = paleta[3 * linha[k]:3 * linha[k] + 3]
+                v = (r * 299 + g * 587 + b * 114) // 1000
+            elif cor == 4:
+                alfa = linha[k + 1]
+                v = (linha[k] * alfa + 255 * (255 - alfa)) // 255
+            else:
+                v = (linha[k] * 299 + linha[k + 1] * 587 + linha[k + 2] * 114) // 1000
+                if cor == 6:
+                    alfa = linha[k + 3]
+                    v = (v * alfa + 255 * (255 - alfa)) // 255
+            cinza[base + x] = v
+    return largura, altura, cinza
+
+
+def _limiar_otsu(pixels: bytearray) -> int:
+    hist = [0] * 256
+    for v in pixels:
+        hist[v] += 1
+    total = len(pixels)
+    soma_total = sum(i * h for i, h in enumerate(hist))
+    soma_fundo = peso_fundo = 0
+    melhor, limiar = -1.0, 127
+    for t in range(256):
+        peso_fundo += hist[t]
+        if peso_fundo == 0:
+            continue
+        peso_frente = total - peso_fundo
+        if peso_frente == 0:
+            break
+        soma_fundo += t * hist[t]
+        m_fundo = soma_fundo / peso_fundo
+        m_frente = (soma_total - soma_fundo) / peso_frente
+        variancia = peso_fundo * peso_frente * (m_fundo - m_frente) ** 2
+        if variancia > melhor:
+            melhor, limiar = variancia, t
+    return limiar
+
+
+# =========================================================
+# RECONHECEDOR (VIZINHO MAIS PRÓXIMO POR CARACTERE)
+# =========================================================
+LADO_GLIFO = 16
+MIN_PIXELS_GLIFO = 6
+MAX_MODELOS_POR_CARACTERE = 200
+
+
+class ReconhecedorCaptcha:
+    """
+    Reconhecimento por modelos: cada caractere segmentado vira um bitmap 16x16 (proporção
+    preservada) e recebe o rótulo do modelo mais próximo (distância de Hamming).
+    Confiança do caractere = 1 - d(melhor) / d(melhor de outro rótulo); a do captcha é a menor.
+    """
+
+    def __init__(
+        self,
+        modelos: Optional[Dict[str, List[int]]] = None,
+        largura_tipica: float = 0.0,
+        tamanhos: Optional[List[int]] = None,
+    ):
+        self.modelos = modelos or {}
+        self.largura_tipica = largura_tipica
+        self.tamanhos = sorted(set(tamanhos or []))
+        self._indice = [(bits, rotulo) for rotulo, lista in self.modelos.items() for bits in lista]
+
+    # ---------- imagem -> glifos ----------
+    @staticmethod
+    def _componentes(largura: int, altura: int, tinta: bytearray) -> List[List[Tuple[int, int]]]:
+        visto = bytearray(len(tinta))
+        comps: List[List[Tuple[int, int]]] = []
+        for inicio in range(len(tinta)):
+            if not tinta[inicio] or visto[inicio]:
+                continue
+            visto[inicio] = 1
+            pilha = [inicio]
+            pixels: List[Tuple[int, int]] = []
+            while pilha:
+                p = pilha.pop()
+                y, x = divmod(p, largura)
+                pixels.append((x, y))
+                for dy in (-1, 0, 1):
+                    yy = y + dy
+                    if yy < 0 or yy >= altura:
+                        continue
+                    for dx in (-1, 0, 1):
+                        xx = x + dx
+                        if 0 <= xx < largura:
+                            q = yy * largura + xx
+                            if tinta[q] and not visto[q]:
+                                visto[q] = 1
+                                pilha.append(q)
+            if len(pixels) >= MIN_PIXELS_GLIFO:
+                comps.append(pixels)
+        return comps
+
+    @staticmethod
+    def _faixa_x(pixels: List[Tuple[int, int]]) -> Tuple[int, int]:
+        xs = [x for x, _ in pixels]
+        return min(xs), max(xs)
+
+    @classmethod
+    def _dividir(cls, pixels: List[Tuple[int, int]]) -> List[List[Tuple[int, int]]]:
+        """
+        Separa caracteres encostados na coluna com menos tinta do terço central.
+        """
+        x0, x1 = cls._faixa_x(pixels)
+        colunas: Dict[int, int] = {}
+        for x, _ in pixels:
+            colunas[x] = colunas.get(x, 0) + 1
+        w = x1 - x0 + 1
+        candidatas = range(x0 + w // 3, x1 - w // 3 + 1)
+        corte = min(candidatas, key=lambda c: colunas.get(c, 0)) if len(candidatas) else x0 + w // 2
+        esquerda = [p for p in pixels if p[0] < corte]
+        direita = [p for p in pixels if p[0] >= corte]
+        return [esquerda, direita] if esquerda and direita else [pixels]
+
+    @staticmethod
+    def _bitmap(pixels: List[Tuple[int, int]]) -> int:
+        xs = [x for x, _ in pixels]
+        ys = [y for _, y in pixels]
+        x0, y0 = min(xs), min(ys)
+        w, h = max(xs) - x0 + 1, max(ys) - y0 + 1
+        lado = max(w, h)
+        ox, oy = x0 - (lado - w) / 2, y0 - (lado - h) / 2
+        cheio = set(pixels)
+        bits = 0
+        for cy in range(LADO_GLIFO):
+            sy = int(oy + (cy + 0.5) * lado / LADO_GLIFO)
+            for cx in range(LADO_GLIFO):
+                if (int(ox + (cx + 0.5) * lado / LADO_GLIFO), sy) in cheio:
+                    bits |= 1 << (cy * LADO_GLIFO + cx)
+        return bits
+
+    def segmentar(self, png: bytes, esperado: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        Retorna [(bitmap, largura em pixels)] dos caracteres, da esquerda para a direita.
+        """
+        largura, altura, cinza = decodificar_png(png)
+        limiar = _limiar_otsu(cinza)
+        tinta = bytearray(1 if v <= limiar else 0 for v in cinza)
+        if sum(tinta) * 2 > len(tinta):  # texto claro em fundo escuro
+            tinta = bytearray(1 - v for v in tinta)
+
+        comps = sorted(self._componentes(largura, altura, tinta), key=lambda c: self._faixa_x(c)[0])
+
+        # junta pedaços do mesmo caractere (pingo do i/j, traço partido) sobrepostos em x
+        juntos: List[List[Tuple[int, int]]] = []
+        for c in comps:
+            if juntos:
+                a0, a1 = self._faixa_x(juntos[-1])
+                b0, b1 = self._faixa_x(c)
+                sobreposicao = min(a1, b1) - max(a0, b0) + 1
+                if sobreposicao >= 0.5 * min(a1 - a0 + 1, b1 - b0 + 1):
+                    juntos[-1] = juntos[-1] + c
+                    continue
+            juntos.append(c)
+
+        alvo = esperado or (self.tamanhos[0] if len(self.tamanhos) == 1 else None)
+        if alvo:
+            while len(juntos) > alvo:  # sobra: descarta a menor mancha (ruído)
+                juntos.remove(min(juntos, key=len))
+        for _ in range(2 * (alvo or 8)):
+            largo = max(juntos, key=lambda c: self._faixa_x(c)[1] - self._faixa_x(c)[0], default=None)
+            if largo is None:
+                break
+            w = self._faixa_x(largo)[1] - self._faixa_x(largo)[0] + 1
+            falta = alvo is not None and len(juntos) < alvo
+            largo_demais = not alvo and self.largura_tipica and w > 1.7 * self.largura_tipica
+            if not (falta or largo_demais):
+                break
+            partes = self._dividir(largo)
+            if len(partes) == 1:
+                break
+            i = juntos.index(largo)
+            juntos[i:i + 1] = partes
+
+        return [(self._bitmap(c), self._faixa_x(c)[1] - self._faixa_x(c)[0] + 1) for c in juntos]
+
+    # ---------- classificação ----------
+    def _classificar(self, bitmap: int) -> Tuple[str, float]:
+        melhor: Dict[str, int] = {}
+        for bits, rotulo in self._indice:
+            d = bin(bitmap ^ bits).count("1")
+            if d < melhor.get(rotulo, LADO_GLIFO * LADO_GLIFO + 1):
+                melhor[rotulo] = d
+        ordem = sorted(melhor.items(), key=lambda kv: kv[1])
+        rotulo, d1 = ordem[0]
+        d2 = ordem[1][1] if len(ordem) > 1 else LADO_GLIFO * LADO_GLIFO
+        return rotulo, (1.0 - d1 / d2) if d2 else 0.0
+
+    def reconhecer(self, png: bytes) -> Optional[Tuple[str, float]]:
+        """
+        (texto, confiança 0-1) ou None se não há modelo ou a segmentação não bate.
+        """
+        if not self._indice:
+            return None
+        glifos = self.segmentar(png)
+        if not glifos or (self.tamanhos and len(glifos) not in self.tamanhos):
+            return None
+        texto: List[str] = []
+        confianca = 1.0
+        for bitmap, _w in glifos:
+            rotulo, conf = self._classificar(bitmap)
+            texto.append(rotulo)
+            confianca = min(confianca, conf)
+        return "".join(texto), confianca
+
+    # ---------- treino / persistência ----------
+    @classmethod
+    def treinar(cls, amostras: List[Tuple[str, bytes]]) -> Tuple["ReconhecedorCaptcha", int]:
+        """
+        Monta o modelo a partir de (resposta aceita, png). Retorna (reconhecedor, amostras usadas);
+        imagens cuja segmentação não dá um glifo por caractere da resposta são ignoradas.
+        """
+        base = cls()
+        modelos: Dict[str, Dict[int, None]] = {}
+        larguras: List[int] = []
+        tamanhos: set = set()
+        usadas = 0
+        for resposta, png in amostras:
+            try:
+                glifos = base.segmentar(png, esperado=len(resposta))
+            except Exception:
+                continue
+            if len(glifos) != len(resposta):
+                continue
+            usadas += 1
+            tamanhos.add(len(resposta))
+            for ch, (bitmap, w) in zip(resposta, glifos):
+                lista = modelos.setdefault(ch, {})
+                if len(lista) < MAX_MODELOS_POR_CARACTERE:
+                    lista[bitmap] = None
+                larguras.append(w)
+        larguras.sort()
+        largura_tipica = float(larguras[len(larguras) // 2]) if larguras else 0.0
+        rec = cls({ch: list(bs) for ch, bs in modelos.items()}, largura_tipica, sorted(tamanhos))
+        return rec, usadas
+
+    def salvar(self, caminho: str):
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+        dados = {
+            "lado": LADO_GLIFO,
+            "largura_tipica": self.largura_tipica,
+            "tamanhos": self.tamanhos,
+            "modelos": {ch: [format(b, "x") for b in bs] for ch, bs in self.modelos.items()},
+        }
+        tmp = caminho + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dados, f)
+        os.replace(tmp, caminho)
+
+    @classmethod
+    def carregar(cls, caminho: str) -> Optional["ReconhecedorCaptcha"]:
+        try:
+            with open(caminho, encoding="utf-8") as f:
+                dados = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning(f"⚠️ Modelo de captcha inválido em {caminho}: {e}")
+            return None
+        if dados.get("lado") != LADO_GLIFO:
+            log.warning(f"⚠️ Modelo de captcha em {caminho} é de outra versão; refaça com 'treinar-captcha'.")
+            return None
+        modelos = {ch: [int(b, 16) for b in bs] for ch, bs in (dados.get("modelos") or {}).items()}
+        return cls(modelos, float(dados.get("largura_tipica") or 0.0), dados.get("tamanhos") or [])
+
+
+# =========================================================
+# DATASET + RESOLVEDOR LOCAL
+# =========================================================
+RE_RESPOSTA_CAPTCHA = re.compile(r"^[A-Za-z0-9]+$")
+
+
+def ler_dataset_captcha(pasta: str) -> List[Tuple[str, str, bytes]]:
+    """
+    [(nome do arquivo, resposta, png)] do dataset, em ordem de nome.
+    """
+    amostras: List[Tuple[str, str, bytes]] = []
+    for nome in sorted(os.listdir(pasta)):
+        resposta, sep, resto = nome.rpartition("_")
+        if not sep or not resto.endswith(".png") or not RE_RESPOSTA_CAPTCHA.match(resposta):
+            continue
+        with open(os.path.join(pasta, nome), "rb") as f:
+            amostras.append((nome, resposta, f.read()))
+    return amostras
+
+
+class ResolvedorLocal(ResolvedorCaptcha):
+    """
+    Tenta o reconhecedor local na própria thread (milissegundos) e, se a confiança ficar
+    abaixo do mínimo, repassa a imagem para o resolvedor de reserva (Anti-Captcha).
+    Lembra quais respostas foram locais para medir o acerto pelo retorno do portal.
+    """
+
+    def __init__(
+        self,
+        reconhecedor: ReconhecedorCaptcha,
+        reserva: Callable[[str], "Future[Optional[str]]"],
+        confianca_min: float = 0.4,
+        metricas: Any = None,
+    ):
+        self.reconhecedor = reconhecedor
+        self.reserva = reserva
+        self.confianca_min = confianca_min
+        self.metricas = metricas if metricas is not None else _SemMetricas()
+        self._lock = threading.Lock()
+        self._respostas_locais: Dict[str, str] = {}
+
+    def resolver(self, b64_image_content: str) -> "Future[Optional[str]]":
+        try:
+            with self.metricas.medir("captcha_local"):
+                res = self.reconhecedor.reconhecer(base64.b64decode(b64_image_content))
+        except Exception as e:
+            log.warning(f"⚠️ Reconhecedor local de captcha falhou: {e}")
+            res = None
+
+        if res is None or res[1] < self.confianca_min:
+            self.metricas.incrementar("captcha_reserva")
+            return self.reserva(b64_image_content)
+
+        texto, confianca = res
+        log.info(f"🧠 Captcha resolvido localmente (confiança {confianca:.2f}): {texto}")
+        self.metricas.incrementar("captcha_local")
+        with self._lock:
+            if len(self._respostas_locais) >= 1000:
+                self._respostas_locais.clear()
+            self._respostas_locais[hashlib.sha1(b64_image_content.encode()).hexdigest()] = texto
+        fut: "Future[Optional[str]]" = Future()
+        fut.set_result(texto)
+        return fut
+
+    def foi_local(self, b64_image_content: str, resposta: str) -> bool:
+        with self._lock:
+            return self._respostas_locais.pop(hashlib.sha1(b64_image_content.encode()).hexdigest(), None) == resposta
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import tempfile
+
+# dfe.py é um script na pasta de cima; o cache local vai para um diretório descartável
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DFE_CACHE_DIR", tempfile.mkdtemp(prefix="dfe-testes-"))
+os.environ.setdefault("DFE_COORDENACAO", "")
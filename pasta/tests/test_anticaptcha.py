@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+import dfe
+
+
+class RespostaFalsa:
+    def __init__(self, corpo):
+        self._corpo = corpo
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._corpo
+
+
+class AntiCaptchaFalso:
+    """createTask devolve taskId = imagem; getTaskResult responde conforme 'resultados'."""
+
+    def __init__(self, resultados, criar_espera=None):
+        self.resultados = resultados
+        self.criar_espera = criar_espera or {}
+
+    def post(self, url, json=None, **kwargs):
+        if url == dfe.URL_ANTI_CREATE:
+            espera = self.criar_espera.get(json["task"]["body"])
+            if espera is not None:
+                espera.wait(10)
+            return RespostaFalsa({"taskId": json["task"]["body"]})
+        resultado = self.resultados[json["taskId"]]
+        if isinstance(resultado, Exception):
+            raise resultado
+        return RespostaFalsa(resultado)
+
+
+@pytest.fixture
+def servico(monkeypatch):
+    def criar(falso, **kwargs):
+        monkeypatch.setattr(dfe, "sessao_anticaptcha", lambda: falso)
+        s = dfe.ServicoAntiCaptcha("chave", **kwargs)
+        s._primeiro_poll = s._intervalo_poll = lambda: 0.0
+        return s
+    return criar
+
+
+def test_resolve(servico):
+    s = servico(AntiCaptchaFalso({"a": {"status": "ready", "solution": {"text": "x7k2"}}}))
+    assert s.resolver("a").result(timeout=5) == "x7k2"
+
+
+@pytest.mark.parametrize("resultado", [["não", "é", "dict"], ValueError("json inválido"), RuntimeError("gravação")])
+def test_erro_inesperado_no_poll_finaliza_a_tarefa(servico, resultado):
+    s = servico(AntiCaptchaFalso({"a": resultado}))
+    assert s.resolver("a").result(timeout=5) is None
+    assert s._pendentes == {}
+
+
+def test_create_task_lento_nao_atrasa_os_polls(servico):
+    liberar = threading.Event()
+    s = servico(AntiCaptchaFalso({"rapido": {"status": "ready", "solution": {"text": "ok"}}},
+                                 criar_espera={"lento1": liberar, "lento2": liberar}), max_em_voo=2)
+    s._primeiro_poll = lambda: 0.3
+    try:
+        rapido = s.resolver("rapido")
+        prazo = time.time() + 5
+        while "rapido" not in s._pendentes and time.time() < prazo:
+            time.sleep(0.01)
+        # os dois workers de createTask ficam presos antes do primeiro poll do "rapido"
+        lentos = [s.resolver("lento1"), s.resolver("lento2")]
+        assert rapido.result(timeout=5) == "ok"
+        assert not any(f.done() for f in lentos)
+    finally:
+        liberar.set()
+    assert [f.result(timeout=5) for f in lentos] == [None, None]  # sem resultado gravado: erro -> None
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+import dfe
+
+
+class _ConexaoContada:
+    def __init__(self, conn, commits):
+        self._conn, self._commits = conn, commits
+
+    def commit(self):
+        self._commits.append(1)
+        self._conn.commit()
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+
+def _acessos(caminho):
+    with sqlite3.connect(caminho) as conn:
+        return dict(conn.execute("SELECT id, acesso FROM detalhes"))
+
+
+def test_get_nao_escreve_no_disco(tmp_path, monkeypatch):
+    caminho = str(tmp_path / "detalhes.sqlite3")
+    cache = dfe.CacheDetalhes(caminho)
+    cache.put("1", {"periodo": "01/09/2026 a 30/09/2026", "doc": "123"})
+    antes = _acessos(caminho)
+
+    commits = []
+    monkeypatch.setattr(cache, "_conn", _ConexaoContada(cache._conn, commits))
+    for _ in range(20):
+        assert cache.get("1") == {"periodo": "01/09/2026 a 30/09/2026", "doc": "123"}
+    assert cache.get("2") is None
+    assert commits == [] and _acessos(caminho) == antes
+
+    cache.gravar_acessos()
+    assert len(commits) == 1
+    assert _acessos(caminho)["1"] > antes["1"]
+
+
+def test_lru_usa_os_acessos_em_memoria(tmp_path):
+    caminho = str(tmp_path / "detalhes.sqlite3")
+    cache = dfe.CacheDetalhes(caminho, max_itens=10)
+    for i in range(10):
+        cache.put(str(i), {"periodo": "p", "doc": None})
+    cache.get("0")  # o mais antigo passa a ser o mais recente
+    cache.put("10", {"periodo": "p", "doc": None})  # passa do limite: volta a 90%
+    assert sorted(_acessos(caminho), key=int) == ["0", "3", "4", "5", "6", "7", "8", "9", "10"]
+
+    reaberto = dfe.CacheDetalhes(caminho, max_itens=10)
+    assert reaberto._total == 9
+
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import base64
+import struct
+import zlib
+from concurrent.futures import Future
+
+import pytest
+
+import captcha_local
+from captcha_local import ReconhecedorCaptcha, ResolvedorCaptcha, ResolvedorLocal, decodificar_png
+
+
+# ---------- PNG de teste (codificador mínimo, com todos os filtros) ----------
+def _chunk(tipo: bytes, corpo: bytes) -> bytes:
+    return struct.pack(">I", len(corpo)) + tipo + corpo + struct.pack(">I", zlib.crc32(tipo + corpo))
+
+
+def _filtrar(filtro: int, linha: bytes, anterior: bytes, bpp: int) -> bytes:
+    saida = bytearray()
+    for x, v in enumerate(linha):
+        a = linha[x - bpp] if x >= bpp else 0
+        b = anterior[x]
+        c = anterior[x - bpp] if x >= bpp else 0
+        if filtro == 0:
+            pred = 0
+        elif filtro == 1:
+            pred = a
+        elif filtro == 2:
+            pred = b
+        elif filtro == 3:
+            pred = (a + b) >> 1
+        else:
+            p = a + b - c
+            pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+            pred = a if pa <= pb and pa <= pc else b if pb <= pc else c
+        saida.append((v - pred) & 0xFF)
+    return bytes(saida)
+
+
+def gerar_png(largura: int, altura: int, linhas, cor: int = 0, paleta: bytes = b"") -> bytes:
+    """
+    linhas: bytes já no formato do tipo de cor (8 bits por canal); o filtro varia por linha.
+    """
+    canais = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[cor]
+    bruto = bytearray()
+    anterior = bytes(largura * canais)
+    for y, linha in enumerate(linhas):
+        filtro = y % 5
+        bruto.append(filtro)
+        bruto += _filtrar(filtro, linha, anterior, canais)
+        anterior = linha
+    png = b"\x89PNG\r\n\x1a\n" + _chunk(b"IHDR", struct.pack(">IIBBBBB", largura, altura, 8, cor, 0, 0, 0))
+    if paleta:
+        png += _chunk(b"PLTE", paleta)
+    return png + _chunk(b"IDAT", zlib.compress(bytes(bruto))) + _chunk(b"IEND", b"")
+
+
+def test_decodifica_png_em_tons_de_cinza():
+    cinzas = [[(x * 37 + y * 11) % 256 for x in range(7)] for y in range(6)]
+    png = gerar_png(7, 6, [bytes(l) for l in cinzas], cor=0)
+    assert decodificar_png(png) == (7, 6, bytearray(v for l in cinzas for v in l))
+
+
+def test_decodifica_rgb_paleta_e_alfa():
+    rgb = [bytes([255, 0, 0, 0, 255, 0, 0, 0, 255]), bytes([10, 10, 10, 200, 200, 200, 0, 0, 0])]
+    _, _, pixels = decodificar_png(gerar_png(3, 2, rgb, cor=2))
+    assert list(pixels) == [76, 149, 29, 10, 200, 0]
+
+    paleta = bytes([0, 0, 0, 255, 255, 255])
+    _, _, pixels = decodificar_png(gerar_png(2, 2, [bytes([0, 1]), bytes([1, 0])], cor=3, paleta=paleta))
+    assert list(pixels) == [0, 255, 255, 0]
+
+    # preto totalmente transparente vira o fundo branco; opaco continua preto
+    _, _, pixels = decodificar_png(gerar_png(2, 1, [bytes([0, 0, 0, 255])], cor=4))
+    assert list(pixels) == [255, 0]
+
+
+def test_rejeita_o_que_nao_e_png():
+    with pytest.raises(ValueError):
+        decodificar_png(b"GIF89a....")
+
+
+# ---------- captchas sintéticos ----------
+FONTE = {
+    "A": ["01110", "10001", "10001", "11111", "10001", "10001", "10001"],
+    "B": ["11110", "10001", "11110", "10001", "10001", "10001", "11110"],
+    "C": ["01111", "10000", "10000", "10000", "10000", "10000", "01111"],
+    "7": ["11111", "00001", "00010", "00100", "01000", "01000", "01000"],
+    "4": ["10010", "10010", "10010", "11111", "00010", "00010", "00010"],
+}
+ESCALA = 3
+
+
+def captcha(texto: str) -> bytes:
+    altura = 7 * ESCALA + 8
+    largura = len(texto) * (5 * ESCALA + 6) + 6
+    pixels = [[235] * largura for _ in range(altura)]
+    for i, ch in enumerate(texto):
+        x0, y0 = 4 + i * (5 * ESCALA + 6), 4 + (i % 2)
+        for gy, linha in enumerate(FONTE[ch]):
+            for gx, bit in enumerate(linha):
+                if bit == "1":
+                    for dy in range(ESCALA):
+                        for dx in range(ESCALA):
+                            pixels[y0 + gy * ESCALA + dy][x0 + gx * ESCALA + dx] = 30
+    return gerar_png(largura, altura, [bytes(l) for l in pixels], cor=0)
+
+
+AMOSTRAS = [("AB7C", captcha("AB7C")), ("C4BA", captcha("C4BA")), ("7A4B", captcha("7A4B"))]
+
+
+def test_segmenta_um_glifo_por_caractere():
+    glifos = ReconhecedorCaptcha().segmentar(captcha("AB7C4"))
+    assert len(glifos) == 5
+    assert all(w == 5 * ESCALA for _bits, w in glifos)
+
+
+def test_reconhece_amostra_rotulada_depois_do_treino(tmp_path):
+    rec, usadas = ReconhecedorCaptcha.treinar(AMOSTRAS)
+    assert usadas == 3
+    assert rec.tamanhos == [4]
+
+    texto, confianca = rec.reconhecer(captcha("4C7A"))
+    assert texto == "4C7A"
+    assert confianca > 0.5
+
+    caminho = str(tmp_path / "modelo.json")
+    rec.salvar(caminho)
+    assert ReconhecedorCaptcha.carregar(caminho).reconhecer(captcha("BBA7"))[0] == "BBA7"
+
+
+def test_sem_modelo_nao_reconhece():
+    assert ReconhecedorCaptcha().reconhecer(captcha("AB7C")) is None
+
+
+def test_dataset_usa_o_nome_do_arquivo_como_resposta(tmp_path):
+    (tmp_path / "AB7C_0123456789ab.png").write_bytes(AMOSTRAS[0][1])
+    (tmp_path / "sem-resposta.png").write_bytes(b"x")
+    assert captcha_local.ler_dataset_captcha(str(tmp_path)) == [("AB7C_0123456789ab.png", "AB7C", AMOSTRAS[0][1])]
+
+
+# ---------- resolvedores ----------
+def test_resolvedor_captcha_e_abstrato():
+    with pytest.raises(TypeError):
+        ResolvedorCaptcha()
+
+
+def test_resolvedor_local_cai_na_reserva_sem_confianca():
+    rec, _ = ReconhecedorCaptcha.treinar(AMOSTRAS)
+    chamadas = []
+
+    def reserva(b64: str) -> "Future":
+        chamadas.append(b64)
+        fut: Future = Future()
+        fut.set_result("RESERVA")
+        return fut
+
+    local = ResolvedorLocal(rec, reserva, confianca_min=0.5)
+    b64 = base64.b64encode(captcha("CAB4")).decode()
+    assert local.resolver(b64).result() == "CAB4"
+    assert local.foi_local(b64, "CAB4")
+    assert not chamadas
+
+    exigente = ResolvedorLocal(rec, reserva, confianca_min=1.01)
+    assert exigente.resolver(b64).result() == "RESERVA"
+    assert chamadas == [b64]
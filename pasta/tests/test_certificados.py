@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+import dfe
+
+
+class SupabaseFalso:
+    def __init__(self, linhas):
+        self.linhas, self.params = linhas, None
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        self.params = params
+        linhas = self.linhas
+
+        class Resposta:
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                return linhas
+
+        return Resposta()
+
+
+def test_vencimento_vazio_ou_fora_do_formato_nao_e_vencido(monkeypatch):
+    monkeypatch.setattr(dfe, "hoje_ro", lambda: date(2026, 10, 18))
+    supabase = SupabaseFalso([
+        {"id": 1, "vencimento": None},
+        {"id": 2, "vencimento": ""},
+        {"id": 3, "vencimento": "31/12/2026"},
+        {"id": 4, "vencimento": "2026-10-18"},
+        {"id": 5, "vencimento": "2026-10-17"},
+        {"id": 6, "vencimento": "2027-01-01T00:00:00"},
+    ])
+    monkeypatch.setattr(dfe, "sessao_supabase", lambda: supabase)
+
+    certs = dfe.carregar_certificados_validos()
+
+    assert [c["id"] for c in certs] == [1, 2, 3, 4, 6]
+    # a query não descarta linhas que o is_vencido aceitaria
+    assert {k: v for k, v in supabase.params.items() if k != "select"} == {"or": "(fazer.is.null,fazer.not.ilike.nao)"}
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import io
+import logging
+import ssl
+import threading
+from contextlib import redirect_stdout
+
+import requests
+
+import dfe
+
+
+def test_log_prefixa_cada_linha_com_a_tag_da_thread():
+    dfe.configurar_log()
+    saida = io.StringIO()
+    with redirect_stdout(saida):
+        with dfe.tag_log("7 Empresa Sete"):
+            dfe.log.info("primeira\nsegunda")
+        dfe.log.info("sem tag")
+    assert saida.getvalue().splitlines() == [
+        "[7 Empresa Sete] primeira",
+        "[7 Empresa Sete] segunda",
+        "sem tag",
+    ]
+
+
+def test_tag_e_por_thread():
+    dfe.configurar_log()
+    saida = io.StringIO()
+    with redirect_stdout(saida):
+        with dfe.tag_log("A"):
+            t = threading.Thread(target=lambda: dfe.log.warning("outra thread"))
+            t.start()
+            t.join()
+    assert saida.getvalue().strip() == "outra thread"
+    assert logging.getLogger("dfe").level == logging.INFO
+
+
+def test_vaga_do_host_so_e_liberada_uma_vez(monkeypatch):
+    monkeypatch.setattr(dfe, "MAX_CONEXOES_POR_HOST", 1)
+    url = "https://host-vaga-unica.teste/x"
+    liberar = dfe.ocupar_vaga_host(url)
+    liberar()
+    liberar()  # BoundedSemaphore estouraria numa segunda liberação
+    segunda = dfe.ocupar_vaga_host(url)
+    assert not dfe._SEMAFOROS_HOST["host-vaga-unica.teste"].acquire(blocking=False)
+    segunda()
+
+
+def test_resposta_em_stream_segura_a_vaga_ate_fechar(monkeypatch):
+    monkeypatch.setattr(dfe, "MAX_CONEXOES_POR_HOST", 1)
+    url = "https://host-stream.teste/zip"
+
+    def enviar(self, request, **kwargs):
+        r = requests.Response()
+        r.status_code = 200
+        r.raw = io.BytesIO(b"conteudo")
+        r.request = request
+        r.url = request.url
+        return r
+
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, "send", enviar)
+    s = dfe.SessaoLimitada()
+    sem = lambda: dfe._SEMAFOROS_HOST["host-stream.teste"]  # noqa: E731
+
+    with s.get(url, stream=True) as r:
+        assert not sem().acquire(blocking=False)  # corpo ainda não lido: vaga ocupada
+        assert b"".join(r.iter_content(4)) == b"conteudo"
+    assert sem().acquire(blocking=False)
+    sem().release()
+
+    s.get(url)  # sem stream a vaga volta na hora
+    assert sem().acquire(blocking=False)
+    sem().release()
+
+
+def test_pool_mtls_compartilha_adaptador_e_nao_a_sessao(monkeypatch):
+    contextos = []
+
+    def contexto(cert_row):
+        contextos.append(cert_row["id"])
+        return ssl.create_default_context()
+
+    monkeypatch.setattr(dfe, "MODO_HTTP", "")
+    monkeypatch.setattr(dfe, "criar_contexto_ssl", contexto)
+    pool = dfe.PoolSessoesMTLS(ociosa_segundos=60)
+    # duas linhas da certifica_dfe com o mesmo certificado
+    a = pool.obter({"id": 1, "hash_chaves": "h"})
+    b = pool.obter({"id": 2, "hash_chaves": "h"})
+    assert a is not b and a.cookies is not b.cookies
+    assert a.get_adapter("https://portal.teste") is b.get_adapter("https://portal.teste")
+    assert (a.cliente_http, b.cliente_http) == ("1", "2")
+    assert contextos == [1]
+
+    assert pool.despejar_ociosas() == 0
+    pool.ociosa_segundos = -1
+    assert pool.despejar_ociosas() == 1
+    c = pool.obter({"id": 1, "hash_chaves": "h"})
+    assert c.get_adapter("https://portal.teste") is not a.get_adapter("https://portal.teste")
+
+
+def test_backfill_da_uma_sessao_por_periodo(monkeypatch):
+    criadas, usadas = [], []
+
+    def obter(cert_row):
+        s = requests.Session()
+        s.cookies.set("ASP.NET_SessionId", "x")
+        criadas.append(s)
+        return s
+
+    def periodo(s, cert_row, solicitacoes, mes, detalhes):
+        usadas.append((mes, s))
+        return dfe.RESULTADO_COMPLETO
+
+    monkeypatch.setattr(dfe, "ledger_conclusao", lambda: None)
+    monkeypatch.setattr(dfe.CATALOGO_CHAVES, "completar", lambda cert_row: cert_row)
+    monkeypatch.setattr(dfe.POOL_SESSOES, "obter", obter)
+    monkeypatch.setattr(dfe, "listar_solicitacoes", lambda s, **kw: [])
+    monkeypatch.setattr(dfe, "processar_periodo_empresa", periodo)
+    monkeypatch.setattr(dfe, "MAX_PERIODOS_PARALELOS", 3)
+
+    meses = ["202401", "202402", "202403"]
+    resultado = dfe.backfill_empresa({"id": 1, "hash_chaves": "h", "codi": 1}, meses)
+
+    assert resultado == {m: dfe.RESULTADO_COMPLETO for m in meses}
+    sessoes = [s for _mes, s in usadas]
+    assert len({id(s) for s in sessoes}) == 3 and criadas[0] not in sessoes
+    assert all(s.cookies.get("ASP.NET_SessionId") == "x" for s in sessoes)
+
+
+def test_upload_grande_nao_conta_como_latencia(monkeypatch):
+    def enviar(self, request, **kwargs):
+        r = requests.Response()
+        r.status_code, r.request, r.url = 200, request, request.url
+        r._content = b"{}"
+        return r
+
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, "send", enviar)
+    s = dfe.SessaoLimitada()
+    url = "https://storage-latencia.teste/object/notas/a.zip"
+    ctrl = dfe.controle_host(url)
+
+    s.post(url, data=io.BytesIO(b"z" * 1024))  # corpo em fluxo (CorpoArquivo)
+    s.post(url, data=b"z" * (dfe.BYTES_MAX_CORPO_LATENCIA + 1))
+    assert ctrl._lat_recente is None and ctrl._lat_base is None
+
+    s.post(url, json={"pequeno": True})
+    s.get(url)
+    assert ctrl._lat_recente is not None
+
+
+def test_amostra_sem_latencia_nao_reduz_o_ritmo():
+    ctrl = dfe.ControleHost("ritmo.teste")
+    for _ in range(5):
+        ctrl.registrar(200, 0.05)
+    taxa = ctrl.taxa
+    for _ in range(5):
+        ctrl.registrar(200, None)  # uploads de vários MB
+    assert ctrl.taxa > taxa and ctrl._lat_recente < 0.1
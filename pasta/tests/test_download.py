@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import base64
+import hashlib
+import io
+import os
+import zipfile
+
+import pytest
+import requests
+
+import dfe
+
+
+def _zip(n_membros: int = 3) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as z:
+        for i in range(n_membros):
+            z.writestr(f"nota{i}.xml", os.urandom(4000))
+    return buf.getvalue()
+
+
+ZIP = _zip()
+
+
+class RespostaFalsa:
+    def __init__(self, status: int, corpo: bytes = b"", headers=None, cai_depois: int = None):
+        self.status_code = status
+        self.headers = requests.structures.CaseInsensitiveDict({"Content-Type": "application/zip", **(headers or {})})
+        self._corpo, self._cai_depois = corpo, cai_depois
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, tamanho):
+        corpo = self._corpo if self._cai_depois is None else self._corpo[:self._cai_depois]
+        for i in range(0, len(corpo), tamanho):
+            yield corpo[i:i + tamanho]
+        if self._cai_depois is not None:
+            raise requests.exceptions.ChunkedEncodingError("conexão caiu")
+
+
+class PortalFalso:
+    def __init__(self, *respostas):
+        self.respostas = list(respostas)
+        self.ranges = []
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        self.ranges.append((headers or {}).get("Range"))
+        return self.respostas.pop(0)
+
+
+def _inteiro(corpo: bytes = ZIP, **headers) -> RespostaFalsa:
+    return RespostaFalsa(200, corpo, {"Content-Length": str(len(corpo)), "ETag": '"v1"', **headers})
+
+
+def _pedaco(inicio: int, corpo: bytes = ZIP) -> RespostaFalsa:
+    return RespostaFalsa(206, corpo[inicio:], {
+        "Content-Range": f"bytes {inicio}-{len(corpo) - 1}/{len(corpo)}",
+        "Content-Length": str(len(corpo) - inicio),
+    })
+
+
+@pytest.fixture
+def prep(tmp_path, monkeypatch):
+    monkeypatch.setattr(dfe, "DIR_CACHE", str(tmp_path))
+    monkeypatch.setattr(dfe, "confirmar_captcha", lambda *a: None)
+    return {"id": "77", "parcial": dfe.DownloadParcial("77"), "action": "https://portal.teste/baixar",
+            "token": "t", "captcha_b64": ""}
+
+
+def _metade_no_disco(parcial: dfe.DownloadParcial) -> int:
+    metade = len(ZIP) // 2
+    with open(parcial.caminho, "wb") as f:
+        f.write(ZIP[:metade])
+    parcial.meta = {"validador": '"v1"', "total": len(ZIP), "sha256": None}
+    parcial.salvar_meta()
+    return metade
+
+
+# ---------- cabeçalhos ----------
+@pytest.mark.parametrize("valor,esperado", [
+    ("bytes 100-999/1000", (100, 1000)),
+    ("bytes 0-0/*", (0, None)),
+    ("bytes   5-9/10", (5, 10)),
+    ("bytes */1000", (None, None)),
+    ("", (None, None)),
+    (None, (None, None)),
+])
+def test_content_range(valor, esperado):
+    assert dfe._content_range(valor) == esperado
+
+
+def test_digest_sha256():
+    sha = hashlib.sha256(b"abc")
+    b64 = base64.b64encode(sha.digest()).decode()
+    assert dfe._digest_sha256({"Repr-Digest": f"sha-256=:{b64}:"}) == sha.hexdigest()
+    assert dfe._digest_sha256({"Digest": f"SHA-256={b64}"}) == sha.hexdigest()
+    assert dfe._digest_sha256({"Repr-Digest": "sha-512=:AAAA:", "Digest": f"sha-256={b64}"}) == sha.hexdigest()
+    assert dfe._digest_sha256({"Digest": "sha-256=:abc:"}) is None  # base64 inválido
+    assert dfe._digest_sha256({}) is None
+
+
+# ---------- validação do ZIP ----------
+def test_validar_zip(tmp_path):
+    caminho = tmp_path / "a.zip"
+    caminho.write_bytes(ZIP)
+    assert dfe.validar_zip(str(caminho), len(ZIP))
+    # diretório central diz que o último membro vai além do tamanho baixado
+    assert not dfe.validar_zip(str(caminho), len(ZIP) // 2)
+
+
+def test_validar_zip_truncado(tmp_path):
+    caminho = tmp_path / "a.zip"
+    caminho.write_bytes(ZIP[:len(ZIP) - 30])  # sem o fim do diretório central
+    assert not dfe.validar_zip(str(caminho), len(ZIP) - 30)
+
+
+# ---------- ramos 206 / 200 / 416 ----------
+def test_206_continua_o_parcial(prep):
+    metade = _metade_no_disco(prep["parcial"])
+    portal = PortalFalso(_pedaco(metade))
+    assert dfe.baixar_zip_retomavel(portal, prep, "abc")
+    assert portal.ranges == [f"bytes={metade}-"]
+    with open(prep["parcial"].caminho, "rb") as f:
+        assert f.read() == ZIP
+    assert prep["parcial"].meta["sha256"] == hashlib.sha256(ZIP).hexdigest()
+
+
+def test_200_ignora_o_range_e_recomeca(prep):
+    metade = _metade_no_disco(prep["parcial"])
+    portal = PortalFalso(_inteiro())
+    assert dfe.baixar_zip_retomavel(portal, prep, "abc")
+    assert portal.ranges == [f"bytes={metade}-"]
+    assert prep["parcial"].tamanho() == len(ZIP)
+    assert prep["parcial"].meta["sha256"] == hashlib.sha256(ZIP).hexdigest()
+
+
+def test_416_descarta_e_baixa_do_inicio(prep):
+    with open(prep["parcial"].caminho, "wb") as f:
+        f.write(b"x" * (len(ZIP) + 10))  # maior do que o arquivo do portal
+    portal = PortalFalso(RespostaFalsa(416, headers={"Content-Type": "text/html"}), _inteiro())
+    assert dfe.baixar_zip_retomavel(portal, prep, "abc")
+    assert portal.ranges == [f"bytes={len(ZIP) + 10}-", None]
+    assert prep["parcial"].tamanho() == len(ZIP)
+
+
+def test_queda_no_meio_retoma_com_range(prep):
+    portal = PortalFalso(RespostaFalsa(200, ZIP, {"Content-Length": str(len(ZIP))}, cai_depois=5000),
+                         _pedaco(5000))
+    assert dfe.baixar_zip_retomavel(portal, prep, "abc")
+    assert portal.ranges == [None, "bytes=5000-"]
+    assert prep["parcial"].meta["sha256"] == hashlib.sha256(ZIP).hexdigest()
+
+
+def test_digest_diferente_descarta(prep):
+    outro = base64.b64encode(hashlib.sha256(b"outro").digest()).decode()
+    portal = PortalFalso(_inteiro(**{"Repr-Digest": f"sha-256=:{outro}:"}))
+    assert not dfe.baixar_zip_retomavel(portal, prep, "abc")
+    assert prep["falha"] == dfe.FALHA_PORTAL
+    assert prep["parcial"].tamanho() == 0
+
+
+# ---------- lock do parcial ----------
+def test_um_worker_por_parcial(prep, monkeypatch):
+    outro = dfe.DownloadParcial("77")
+    assert outro.travar()
+    try:
+        assert not prep["parcial"].travar()
+        assert not dfe.concluir_download_dfe(PortalFalso(), prep, "abc", "notas/a.zip")
+        assert prep["falha"] == dfe.FALHA_REDE
+    finally:
+        outro.soltar()
+
+    monkeypatch.setattr(dfe, "enviar_zip_para_storage", lambda *a: True)
+    assert dfe.concluir_download_dfe(PortalFalso(_inteiro()), prep, "abc", "notas/a.zip")
+    assert prep["parcial"].tamanho() == 0
+    assert outro.travar()  # o lock foi solto no fim
+    outro.soltar()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+import requests
+from urllib3.response import HTTPResponse
+
+import dfe
+
+PASTA = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _rodar(codigo_ou_args, tmp_path, **env):
+    ambiente = {**os.environ, "TMPDIR": str(tmp_path / "tmp"), **env}
+    ambiente.pop("DFE_CACHE_DIR", None)
+    ambiente["HOME"] = str(tmp_path / "home")
+    os.makedirs(ambiente["TMPDIR"], exist_ok=True)
+    return subprocess.run([sys.executable, *codigo_ou_args], cwd=PASTA, env=ambiente,
+                          capture_output=True, text=True, timeout=60)
+
+
+def test_importar_em_modo_reproducao_nao_cria_diretorio(tmp_path):
+    r = _rodar(["-c", "import dfe; print(dfe.DIR_CACHE)"], tmp_path, DFE_HTTP_MODO="reproduzir")
+    assert r.returncode == 0, r.stderr
+    assert r.stdout.strip() == str(tmp_path / "home" / ".cache" / "dfe")
+    assert os.listdir(tmp_path / "tmp") == []
+
+
+def test_cache_descartavel_da_reproducao_e_apagado_na_saida(tmp_path):
+    arquivo = str(tmp_path / "gravacao.sqlite3")
+    dfe.GravacaoHTTP(arquivo, reproduzindo=False)  # gravação vazia, só com a data
+    r = _rodar(["dfe.py", "resumo-mes", "--empresa", "1", "--mes", "202601"], tmp_path,
+               DFE_HTTP_MODO="reproduzir", DFE_HTTP_ARQUIVO=arquivo)
+    assert r.returncode == 0, r.stderr
+    assert "Cache local da reprodução" in r.stdout
+    assert os.listdir(tmp_path / "tmp") == []
+
+
+# ---------- gravação e reprodução pela SessaoLimitada ----------
+ZIP_FALSO = bytes(range(256)) * 64  # 16 KB
+
+
+class _CorpoQueCai(io.RawIOBase):
+    def __init__(self, dados: bytes, cai_em: int):
+        self._dados, self._pos, self._cai_em = dados, 0, cai_em
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._pos >= self._cai_em:
+            raise ConnectionResetError("conexão caiu")
+        n = min(len(b), self._cai_em - self._pos)
+        b[:n] = self._dados[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+@pytest.fixture
+def portal_falso(monkeypatch):
+    respostas = []
+
+    def enviar(self, request, **kwargs):
+        status, headers, corpo = respostas.pop(0)
+        r = requests.Response()
+        r.status_code = status
+        r.headers = requests.structures.CaseInsensitiveDict(headers)
+        r.raw = HTTPResponse(body=corpo, headers=headers, status=status, preload_content=False)
+        r.request, r.url, r.reason = request, request.url, "OK"
+        if not kwargs.get("stream"):
+            r.content  # noqa: B018 - como o requests faz sem stream
+        return r
+
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, "send", enviar)
+    return respostas
+
+
+def _modo(monkeypatch, modo: str, arquivo: str):
+    monkeypatch.setattr(dfe, "MODO_HTTP", modo)
+    monkeypatch.setattr(dfe, "ARQUIVO_HTTP", arquivo)
+    monkeypatch.setattr(dfe, "_GRAVACAO_HTTP", None)
+
+
+def test_stream_gravado_sem_buffer_e_queda_reproduzida_no_mesmo_byte(tmp_path, monkeypatch, portal_falso):
+    arquivo = str(tmp_path / "g.sqlite3")
+    cabecalhos = {"Content-Type": "application/zip", "Content-Length": str(len(ZIP_FALSO))}
+    portal_falso.append((200, cabecalhos, _CorpoQueCai(ZIP_FALSO, 5000)))
+    url = "https://portal.teste/solicitacoes/baixar/1"
+
+    _modo(monkeypatch, "gravar", arquivo)
+    s = dfe.SessaoLimitada()
+    recebido = bytearray()
+    with s.get(url, stream=True) as r:
+        assert r._content is False  # a gravação não leu o corpo antes do chamador
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            for bloco in r.iter_content(1024):
+                recebido += bloco
+    parcial = len(recebido)
+    assert 0 < parcial <= 5000
+    portal_falso.append((206, {**cabecalhos, "Content-Length": str(len(ZIP_FALSO) - parcial), "Content-Range": f"bytes {parcial}-{len(ZIP_FALSO) - 1}/{len(ZIP_FALSO)}"},
+                         io.BytesIO(ZIP_FALSO[parcial:])))
+    with s.get(url, stream=True, headers={"Range": f"bytes={parcial}-"}) as r:
+        recebido += b"".join(r.iter_content(1024))
+    assert bytes(recebido) == ZIP_FALSO
+
+    _modo(monkeypatch, "reproduzir", arquivo)
+    s = dfe.SessaoLimitada()
+    reproduzido = bytearray()
+    with s.get(url, stream=True) as r:
+        assert r.headers["Content-Length"] == str(len(ZIP_FALSO))
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            for bloco in r.iter_content(1024):
+                reproduzido += bloco
+    assert len(reproduzido) == parcial
+    with s.get(url, stream=True, headers={"Range": f"bytes={parcial}-"}) as r:
+        assert r.status_code == 206
+        reproduzido += b"".join(r.iter_content(1024))
+    assert bytes(reproduzido) == ZIP_FALSO
+
+
+def test_segredos_nao_vao_para_o_arquivo(tmp_path, monkeypatch, portal_falso):
+    arquivo = str(tmp_path / "g.sqlite3")
+    corpo = b'[{"id": 1, "pem": "UEVNLVNFQ1JFVE8=", "key": "S0VZLVNFQ1JFVEE="}]'
+    portal_falso.append((200, {"Content-Type": "application/json", "Set-Cookie": "sessao=abc"}, io.BytesIO(corpo)))
+    url = "https://supabase.teste/rest/v1/certifica_dfe?select=id,pem,key&id=eq.1"
+
+    _modo(monkeypatch, "gravar", arquivo)
+    dfe.SessaoLimitada().get(url, headers=dfe.supabase_headers())
+
+    bruto = b"".join(open(arquivo, "rb").read().split())
+    assert b"UEVNLVNFQ1JFVE8" not in bruto and b"sessao=abc" not in bruto
+
+    _modo(monkeypatch, "reproduzir", arquivo)
+    r = dfe.SessaoLimitada().get(url, headers=dfe.supabase_headers())
+    linha = r.json()[0]
+    assert linha["pem"].startswith("<redigido:") and linha["key"].startswith("<redigido:")
+    assert linha["pem"] != linha["key"]
+    assert r.headers["Set-Cookie"] == "<redigido>"
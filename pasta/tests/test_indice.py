@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+import dfe
+
+
+@pytest.fixture
+def zip_baixado(tmp_path, monkeypatch):
+    monkeypatch.setattr(dfe, "DIR_CACHE", str(tmp_path))
+    parcial = dfe.DownloadParcial("1234")
+    with zipfile.ZipFile(parcial.caminho, "w") as z:
+        z.writestr("nota.xml", "<nfeProc/>")
+    parcial.meta = {"sha256": "0" * 64, "total": parcial.tamanho()}
+    parcial.salvar_meta()
+    monkeypatch.setattr(dfe, "enviar_zip_para_storage", lambda *a, **k: True)
+    monkeypatch.setattr(dfe, "INDEXAR_XML", True)
+    return parcial
+
+
+@pytest.mark.parametrize("erro", [sqlite3.OperationalError("disk I/O error"), RuntimeError("pool quebrado")])
+def test_falha_no_indice_nao_desfaz_o_download(zip_baixado, monkeypatch, erro):
+    def falhar(*_a, **_k):
+        raise erro
+
+    monkeypatch.setattr(dfe, "gravar_indice_sqlite", falhar)
+    prep = {"parcial": zip_baixado, "ja_baixado": True}
+    assert dfe.concluir_download_dfe(None, prep, None, "notas/202609-1-NFe.zip")
+    assert "falha" not in prep
+    assert zip_baixado.tamanho() == 0  # parcial descartado mesmo com o índice falhando
+
+
+def test_indexar_e_enviar_so_loga_erros(tmp_path, monkeypatch):
+    monkeypatch.setattr(dfe, "indexar_zip", lambda caminho: (_ for _ in ()).throw(ValueError("xml estranho")))
+    assert dfe.indexar_e_enviar(str(tmp_path / "x.zip"), "notas/x.zip") is False
+
+
+def test_indice_ok_envia_e_descarta(zip_baixado, monkeypatch):
+    enviados = []
+    monkeypatch.setattr(dfe, "resumos_mensais", lambda: None)
+    monkeypatch.setattr(dfe, "upload_para_storage",
+                        lambda caminho, corpo, content_type=None: enviados.append(caminho) or True)
+    monkeypatch.setattr(dfe, "MAX_PROCESSOS_PARSING", 0)
+    assert dfe.concluir_download_dfe(None, {"parcial": zip_baixado, "ja_baixado": True}, None, "notas/a.zip")
+    assert enviados == [dfe.caminho_indice_storage("notas/a.zip")]
+    assert zip_baixado.tamanho() == 0
+
+
+def test_zip_invalido_nao_indexa(tmp_path):
+    caminho = tmp_path / "ruim.zip"
+    caminho.write_bytes(b"PK\x03\x04lixo")
+    assert dfe.indexar_e_enviar(str(caminho), "notas/ruim.zip") is False
+
+
+def _nfe(n: int, cstat: str = "100") -> str:
+    chave = f"{n:044d}"
+    return (f'<nfeProc><NFe><infNFe Id="NFe{chave}"><ide><mod>55</mod><dhEmi>2026-09-0{n % 9 + 1}T10:00:00</dhEmi></ide>'
+            f"<emit><CNPJ>11</CNPJ></emit><dest><CPF>22</CPF></dest><total><ICMSTot><vNF>{n}.50</vNF></ICMSTot></total>"
+            f"</infNFe></NFe><protNFe><infProt><chNFe>{chave}</chNFe><cStat>{cstat}</cStat></infProt></protNFe></nfeProc>")
+
+
+def _cancelamento(n: int) -> str:
+    return (f"<procEventoNFe><retEvento><infEvento><chNFe>{n:044d}</chNFe><tpEvento>110111</tpEvento>"
+            "<cStat>135</cStat></infEvento></retEvento></procEventoNFe>")
+
+
+@pytest.fixture
+def zip_notas(tmp_path):
+    caminho = tmp_path / "notas.zip"
+    with zipfile.ZipFile(caminho, "w", zipfile.ZIP_DEFLATED) as z:
+        for n in range(1, 10):
+            z.writestr(f"{n}.xml", _nfe(n))
+        z.writestr("leia-me.txt", "x")
+        z.writestr("quebrado.xml", "<nfeProc><NFe>")
+        z.writestr("cancelamento-3.xml", _cancelamento(3))
+        z.writestr("cancelamento-fora.xml", _cancelamento(99))
+    return str(caminho)
+
+
+def _fds_apontando_para(pids, caminho):
+    abertos = []
+    for pid in pids:
+        pasta = f"/proc/{pid}/fd"
+        for fd in os.listdir(pasta):
+            try:
+                if os.readlink(os.path.join(pasta, fd)).startswith(caminho):
+                    abertos.append((pid, fd))
+            except OSError:
+                pass
+    return abertos
+
+
+def test_pool_de_parsing_igual_ao_processo_e_sem_zip_aberto(zip_notas, monkeypatch):
+    monkeypatch.setattr(dfe, "MEMBROS_POR_FATIA", 2)
+    monkeypatch.setattr(dfe, "MAX_PROCESSOS_PARSING", 0)
+    esperado = dfe.indexar_zip(zip_notas)
+    assert esperado[1] == 2  # leia-me.txt e quebrado.xml
+    assert len(esperado[0]) == 10 and esperado[0][f"{3:044d}"]["status"] == "cancelada"
+    assert esperado[0][f"{99:044d}"] == {"chave": f"{99:044d}", "status": "cancelada"}
+
+    monkeypatch.setattr(dfe, "MAX_PROCESSOS_PARSING", 2)
+    pool = dfe.pool_parsing()
+    try:
+        assert dfe.indexar_zip(zip_notas) == esperado
+        # os processos do pool não seguram o ZIP depois do lote (o parcial é apagado em seguida)
+        assert _fds_apontando_para(list(pool._processes), zip_notas) == []
+    finally:
+        dfe._descartar_pool_parsing(pool)
+
+
+def test_uma_cpu_indexa_no_proprio_processo():
+    codigo = "import os; os.cpu_count = lambda: 1; import dfe; print(dfe.MAX_PROCESSOS_PARSING)"
+    ambiente = {k: v for k, v in os.environ.items() if k != "MAX_PROCESSOS_PARSING"}
+    r = subprocess.run([sys.executable, "-c", codigo], cwd=os.path.dirname(os.path.abspath(dfe.__file__)),
+                       env=ambiente, capture_output=True, text=True, timeout=60)
+    assert r.stdout.strip() == "0", r.stderr
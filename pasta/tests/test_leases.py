@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import time
+from typing import Any, Dict, List
+
+import pytest
+
+import dfe
+
+
+@pytest.fixture
+def sqlite(tmp_path):
+    return dfe.LeasesSQLite(str(tmp_path / "leases.sqlite3"))
+
+
+def test_armazem_e_abstrato():
+    with pytest.raises(TypeError):
+        dfe.ArmazemLeases()
+
+
+# ---------- SQLite ----------
+def test_sqlite_adquire_e_bloqueia_outro_dono(sqlite):
+    agora = time.time()
+    assert sqlite.adquirir("emp1", "no-a", agora + 60)
+    assert not sqlite.adquirir("emp1", "no-b", agora + 60)
+    assert sqlite.adquirir("emp1", "no-a", agora + 120)  # o mesmo dono pode repegar
+    assert sqlite.expira_em("emp1") == pytest.approx(agora + 120)
+    assert sqlite.adquirir("emp2", "no-b", agora + 60)  # outra empresa é independente
+
+
+def test_sqlite_assume_lease_vencido(sqlite):
+    agora = time.time()
+    assert sqlite.adquirir("emp1", "no-a", agora - 1)
+    assert sqlite.adquirir("emp1", "no-b", agora + 60)
+    assert not sqlite.renovar("emp1", "no-a", agora + 600)  # o antigo dono perdeu
+    assert sqlite.renovar("emp1", "no-b", agora + 600)
+    assert sqlite.expira_em("emp1") == pytest.approx(agora + 600)
+
+
+def test_sqlite_soltar_com_e_sem_reserva(sqlite):
+    agora = time.time()
+    sqlite.adquirir("emp1", "no-a", agora + 60)
+    sqlite.soltar("emp1", "no-b")  # só o dono solta
+    assert sqlite.expira_em("emp1") is not None
+
+    sqlite.soltar("emp1", "no-a", reservar_ate=agora + 3600)
+    assert sqlite.expira_em("emp1") == pytest.approx(agora + 3600)
+    assert not sqlite.adquirir("emp1", "no-b", agora + 60)
+
+    sqlite.soltar("emp1", "no-a", reservar_ate=agora - 5)  # reserva no passado = soltar
+    assert sqlite.expira_em("emp1") is None
+    assert sqlite.adquirir("emp1", "no-b", agora + 60)
+
+
+# ---------- Supabase (PostgREST falso) ----------
+class _Resposta:
+    def __init__(self, status: int, dados: Any = None):
+        self.status_code = status
+        self._dados = dados
+
+    def json(self):
+        return self._dados
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise AssertionError(f"HTTP {self.status_code}")
+
+
+class PostgrestFalso:
+    """
+    Tabela dfe_leases em memória com os filtros que LeasesSupabase usa (eq, lt, or=(...)).
+    """
+
+    def __init__(self):
+        self.linhas: Dict[str, Dict[str, Any]] = {}
+        self.patches: List[Dict[str, str]] = []
+
+    @staticmethod
+    def _condicao(linha: Dict[str, Any], expr: str) -> bool:
+        coluna, op, valor = expr.split(".", 2)
+        if op == "eq":
+            return str(linha[coluna]) == valor
+        if op == "lt":
+            return float(linha[coluna]) < float(valor)
+        raise AssertionError(f"operador não suportado: {op}")
+
+    def _filtrar(self, params: Dict[str, str]) -> List[Dict[str, Any]]:
+        saida = []
+        for linha in self.linhas.values():
+            ok = True
+            for chave, expr in params.items():
+                if chave == "select":
+                    continue
+                if chave == "or":
+                    ok = ok and any(self._condicao(linha, e) for e in expr.strip("()").split(","))
+                else:
+                    ok = ok and self._condicao(linha, f"{chave}.{expr}")
+            if ok:
+                saida.append(linha)
+        return saida
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        if json["chave"] in self.linhas:
+            return _Resposta(409, {"code": "23505"})
+        self.linhas[json["chave"]] = dict(json)
+        return _Resposta(201, [dict(json)])
+
+    def patch(self, url, headers=None, params=None, json=None, timeout=None):
+        self.patches.append(dict(params))
+        alvo = self._filtrar(params)
+        for linha in alvo:
+            linha.update(json)
+        return _Resposta(200, [dict(l) for l in alvo])
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        return _Resposta(200, [{"expira": l["expira"]} for l in self._filtrar(params)])
+
+    def delete(self, url, headers=None, params=None, timeout=None):
+        for linha in self._filtrar(params):
+            del self.linhas[linha["chave"]]
+        return _Resposta(204)
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    falso = PostgrestFalso()
+    monkeypatch.setattr(dfe, "sessao_supabase", lambda: falso)
+    return falso, dfe.LeasesSupabase("dfe_leases")
+
+
+def test_supabase_insere_e_conflito_cai_no_patch_filtrado(supabase):
+    falso, leases = supabase
+    agora = time.time()
+    assert leases.adquirir("emp1", "no-a", agora + 60)
+    assert not falso.patches
+
+    assert not leases.adquirir("emp1", "no-b", agora + 60)  # 409 -> PATCH que não casa
+    filtro = falso.patches[-1]
+    assert filtro["chave"] == "eq.emp1"
+    assert filtro["or"].startswith("(expira.lt.") and filtro["or"].endswith(",dono.eq.no-b)")
+    assert falso.linhas["emp1"]["dono"] == "no-a"
+
+    assert leases.adquirir("emp1", "no-a", agora + 90)  # mesmo dono: o PATCH casa por dono.eq
+    assert leases.expira_em("emp1") == pytest.approx(agora + 90)
+
+
+def test_supabase_assume_lease_vencido(supabase):
+    falso, leases = supabase
+    agora = time.time()
+    leases.adquirir("emp1", "no-a", agora - 1)
+    assert leases.adquirir("emp1", "no-b", agora + 60)
+    assert falso.linhas["emp1"]["dono"] == "no-b"
+    assert not leases.renovar("emp1", "no-a", agora + 600)
+
+
+def test_supabase_soltar_com_reserva_e_sem(supabase):
+    falso, leases = supabase
+    agora = time.time()
+    leases.adquirir("emp1", "no-a", agora + 60)
+    leases.soltar("emp1", "no-a", reservar_ate=agora + 3600)
+    assert leases.expira_em("emp1") == pytest.approx(agora + 3600)
+    leases.soltar("emp1", "no-a")
+    assert leases.expira_em("emp1") is None
+
+
+# ---------- reserva depois do processamento ----------
+def test_empresa_fica_reservada_ate_a_proxima_verificacao(sqlite, monkeypatch):
+    coord_a = dfe.CoordenadorLeases(sqlite, dono="no-a", prazo=600)
+    coord_b = dfe.CoordenadorLeases(sqlite, dono="no-b", prazo=600)
+    monkeypatch.setattr(dfe, "coordenador_leases", lambda: coord_a)
+    monkeypatch.setattr(dfe, "fluxo_completo_para_empresa", lambda cert_row: dfe.RESULTADO_AGUARDANDO)
+    monkeypatch.setattr(dfe.FILA_RETENTATIVAS, "prazo_empresa", lambda cert_row: None)
+
+    cert = {"id": 42, "codi": 42, "empresa": "Empresa 42"}
+    agendador = dfe.AgendadorEmpresas()
+    dfe._processar_empresa_isolada(cert, agendador)
+
+    proxima = agendador.proxima(cert)
+    assert sqlite.expira_em("42") == pytest.approx(proxima)
+    assert not coord_b.tentar("42")  # outro nó não refaz neste ciclo
+    assert coord_a.tentar("42")
+
+
+def test_reserva_cobre_retentativa_pendente(sqlite, monkeypatch):
+    coord = dfe.CoordenadorLeases(sqlite, dono="no-a", prazo=600)
+    prazo_retentativa = time.time() + 5000
+    monkeypatch.setattr(dfe, "coordenador_leases", lambda: coord)
+    monkeypatch.setattr(dfe, "fluxo_completo_para_empresa", lambda cert_row: dfe.RESULTADO_DOWNLOAD)
+    monkeypatch.setattr(dfe.FILA_RETENTATIVAS, "prazo_empresa", lambda cert_row: prazo_retentativa)
+
+    cert = {"id": 7, "codi": 7, "empresa": "Empresa 7"}
+    dfe._processar_empresa_isolada(cert, dfe.AgendadorEmpresas())
+    assert sqlite.expira_em("7") == pytest.approx(prazo_retentativa + dfe.LEASE_SEGUNDOS)
+
+
+def test_empresa_com_lease_de_outro_no_e_adiada(sqlite, monkeypatch):
+    sqlite.adquirir("9", "no-b", time.time() + 300)
+    coord = dfe.CoordenadorLeases(sqlite, dono="no-a", prazo=600)
+    monkeypatch.setattr(dfe, "coordenador_leases", lambda: coord)
+    monkeypatch.setattr(dfe, "fluxo_completo_para_empresa",
+                        lambda cert_row: pytest.fail("não devia processar empresa de outro nó"))
+
+    cert = {"id": 9, "codi": 9, "empresa": "Empresa 9"}
+    agendador = dfe.AgendadorEmpresas()
+    dfe._processar_empresa_isolada(cert, agendador)
+    assert agendador.proxima(cert) == pytest.approx(sqlite.expira_em("9"))
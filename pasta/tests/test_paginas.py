@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import ssl
+
+import pytest
+import requests
+from urllib3.response import HTTPResponse
+
+import dfe
+
+PAGINAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "paginas")
+URL_DETALHES = "https://portal.teste/solicitacoes/detalhes/90817"
+
+
+def _pagina(nome: str) -> str:
+    with open(os.path.join(PAGINAS, nome), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("nome", ["listagem.html", "listagem_sem_tbody.html"])
+def test_listagem_lxml_igual_bs4(nome):
+    html = _pagina(nome)
+    rapido = dfe._parse_listagem_rapido(html)
+    assert rapido is not None
+    assert rapido == dfe._parse_listagem_bs4(html)
+
+
+def test_listagem_campos(caplog):
+    itens, proxima = dfe.parse_pagina_listagem(_pagina("listagem.html"))
+    assert [(i["id"], i["documento"], i["estado"]) for i in itens] == [
+        ("90817", "NF-e", "CONCLUÍDO"),
+        ("90816", "NFC-e", "GERANDO"),
+        ("90655", "NF-e", "CONCLUÍDO"),
+    ]
+    assert itens[0]["data"] == "03/10/2026 08:14:02"
+    assert itens[0]["file_name"] == "NF-e_90817.zip"
+    assert proxima == dfe.urljoin(dfe.URL_SOLICITACOES, "/solicitacoes?page=2")
+    assert "Extração rápida" not in caplog.text
+
+
+@pytest.mark.parametrize("nome", ["detalhes.html", "detalhes_sem_tabela.html"])
+def test_detalhes_lxml_igual_bs4(nome):
+    html = _pagina(nome)
+    rapido = dfe._parse_detalhes_rapido(html, URL_DETALHES)
+    assert rapido is not None
+    assert rapido == dfe._parse_detalhes_bs4(html, URL_DETALHES)
+
+
+def test_detalhes_campos():
+    det = dfe.parse_detalhes_solicitacao(_pagina("detalhes.html"), URL_DETALHES)
+    assert det == {
+        "periodo": "09/2026",
+        "doc": "12345678000190",
+        "captcha_url": dfe.URL_BASE + "/solicitacoes/get_captcha_download/90817",
+        "detalhes_url": URL_DETALHES,
+    }
+
+
+def test_detalhes_sem_tabela_nao_cai_no_bs4(caplog, monkeypatch):
+    def nao_chamar(*_a):
+        raise AssertionError("BeautifulSoup não deveria ser usado")
+
+    monkeypatch.setattr(dfe, "_parse_detalhes_bs4", nao_chamar)
+    det = dfe.parse_detalhes_solicitacao(_pagina("detalhes_sem_tabela.html"), URL_DETALHES)
+    assert det == {"periodo": None, "doc": None, "captcha_url": None, "detalhes_url": URL_DETALHES}
+    assert "Extração rápida" not in caplog.text
+
+
+def test_modal_lxml_igual_bs4():
+    html = _pagina("modal.html")
+    rapido = dfe._parse_form_modal_rapido(html)
+    assert rapido == dfe._parse_form_modal_bs4(html)
+    assert rapido["action"] == "/solicitacoes/download/90817"
+    assert rapido["token"] == "f3a9c0de"
+    assert rapido["b64"].startswith("iVBORw0KGgo")
+
+
+def test_modal_sem_captcha_nos_dois_caminhos():
+    html = _pagina("modal.html").replace('src="data:image/png;base64,', 'src="/img/captcha.png?')
+    assert dfe._parse_form_modal_rapido(html) is None
+    assert dfe._parse_form_modal_bs4(html) is None
+
+
+def test_listagem_condicional_entre_varreduras(monkeypatch):
+    html = _pagina("listagem.html").encode("utf-8")
+    pedidos = []
+
+    def enviar(self, request, **kwargs):
+        pedidos.append(request.headers.get("If-None-Match"))
+        status, corpo = (304, b"") if request.headers.get("If-None-Match") == '"v1"' else (200, html)
+        r = requests.Response()
+        r.status_code, r.url, r.request = status, request.url, request
+        r.headers = requests.structures.CaseInsensitiveDict({"ETag": '"v1"', "Content-Type": "text/html"})
+        r.raw = HTTPResponse(body=io.BytesIO(corpo), status=status, preload_content=False)
+        return r
+
+    parses = []
+    parse_original = dfe.parse_pagina_listagem
+    monkeypatch.setattr(dfe, "parse_pagina_listagem", lambda h: parses.append(1) or parse_original(h))
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, "send", enviar)
+    monkeypatch.setattr(dfe, "MODO_HTTP", "")
+    monkeypatch.setattr(dfe, "cache_detalhes", lambda: None)
+    monkeypatch.setattr(dfe, "criar_contexto_ssl", lambda cert_row: ssl.create_default_context())
+    monkeypatch.setattr(dfe, "_PAGINAS_LISTAGEM", {})
+    cert_row = {"id": 41, "hash_chaves": "listagem-condicional"}
+
+    varreduras = [dfe.listar_solicitacoes(dfe.POOL_SESSOES.obter(cert_row), max_paginas=1) for _ in range(2)]
+
+    assert pedidos == [None, '"v1"']
+    assert len(parses) == 1
+    assert varreduras[0] == varreduras[1] and len(varreduras[0]) == 3
+    assert dfe.despejar_paginas_listagem(ociosa_segundos=-1) == 1
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+from concurrent.futures import Future
+
+import dfe
+
+
+def _pronto(valor="abc"):
+    fut = Future()
+    fut.set_result(valor)
+    return fut
+
+
+def test_erro_local_numa_unidade_nao_derruba_as_outras(monkeypatch):
+    def preparar_download(s, item):
+        if item["id"] == "1":
+            raise OSError("disco cheio")
+        return {"id": item["id"], "captcha": _pronto()}
+
+    def concluir_download(s, prep, captcha, storage_path):
+        if prep["id"] == "2":
+            raise sqlite3.OperationalError("database is locked")
+        return True
+
+    concluidas = []
+    monkeypatch.setattr(dfe, "preparar_download_dfe", preparar_download)
+    monkeypatch.setattr(dfe, "concluir_download_dfe", concluir_download)
+    monkeypatch.setattr(dfe, "preparar_solicitacao", lambda s, nome, codigo, mes: {"captcha": _pronto()})
+    monkeypatch.setattr(dfe, "concluir_solicitacao", lambda s, prep, captcha: concluidas.append(captcha) or True)
+
+    downloads = [("NFe", {"id": "1"}, "a.zip"), ("CTe", {"id": "2"}, "b.zip"), ("NFCe", {"id": "3"}, "c.zip")]
+    falhos, tipos_falhos = dfe.executar_pipeline_empresa(None, downloads, ["NFe"], "202609")
+
+    assert sorted((ref[1]["id"], falha) for ref, falha in falhos) == [("1", dfe.FALHA_PORTAL), ("2", dfe.FALHA_PORTAL)]
+    assert tipos_falhos == [] and concluidas == ["abc"]
+
+
+
+def test_tentar_download_classifica_erro_local(monkeypatch):
+    def preparar(s, item):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(dfe, "preparar_download_dfe", preparar)
+    assert dfe.tentar_download(None, {"id": "9"}, "x.zip") == dfe.FALHA_PORTAL
+
+
+def test_tentar_solicitacao_classifica_erro_inesperado(monkeypatch):
+    def preparar(s, nome, codigo, mes):
+        raise Exception("Erro na extração dos tokens de segurança (CSRF, Token, CNPJ).")
+
+    monkeypatch.setattr(dfe, "preparar_solicitacao", preparar)
+    assert dfe.tentar_solicitacao(None, "NFe", dfe.DFE_TYPES_MAP["NFe"], "202609") == dfe.FALHA_PORTAL
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+import dfe
+
+EMPRESA_A = {"id": 1, "codi": 10}
+EMPRESA_B = {"id": 2, "codi": 20}
+
+
+@pytest.fixture
+def fila():
+    f = dfe.FilaRetentativas(max_workers=2)
+    f._despachar = lambda: None  # só agenda; os testes de despacho usam a fila inteira
+    return f
+
+
+def _tarefa(op="solicitacao", tipo="NFe", tentativa=1, cert_row=EMPRESA_A, mes="202405"):
+    tarefa = {"op": op, "tipo": tipo, "mes_cod": mes, "cert_row": cert_row, "tentativa": tentativa}
+    if op == "download":
+        tarefa.update(item={"id": "99"}, storage_path="x/y.zip")
+    return tarefa
+
+
+@pytest.mark.parametrize("jitter", [0.5, 1.5])
+@pytest.mark.parametrize("falha,tentativa", [
+    (dfe.FALHA_CAPTCHA, 1), (dfe.FALHA_PORTAL, 2), (dfe.FALHA_REDE, 3), ("desconhecida", 1),
+])
+def test_espera_exponencial_com_jitter(fila, monkeypatch, falha, tentativa, jitter):
+    monkeypatch.setattr(dfe.random, "uniform", lambda a, b: jitter)
+    antes = time.time()
+    assert fila.agendar(_tarefa(tentativa=tentativa), falha)
+    quando = fila._heap[0][0]
+
+    base = dfe.ESPERA_BASE_FALHA.get(falha, dfe.ESPERA_BASE_FALHA[dfe.FALHA_PORTAL])
+    esperado = min(base * 2 ** (tentativa - 1) * jitter, dfe.ESPERA_MAX_RETENTATIVA)
+    assert antes + esperado <= quando <= time.time() + esperado
+
+
+def test_espera_limitada_ao_maximo(fila, monkeypatch):
+    monkeypatch.setattr(dfe.random, "uniform", lambda a, b: b)
+    monkeypatch.setattr(dfe, "MAX_TENTATIVAS", 50)
+    assert fila.agendar(_tarefa(tentativa=20), dfe.FALHA_REDE)
+    assert fila._heap[0][0] - time.time() <= dfe.ESPERA_MAX_RETENTATIVA
+
+
+def test_limite_de_tentativas_por_operacao(fila):
+    limite_download = dfe.MAX_TENTATIVAS_DOWNLOAD
+    assert limite_download < dfe.MAX_TENTATIVAS
+
+    assert not fila.agendar(_tarefa("download", tentativa=limite_download), dfe.FALHA_REDE)
+    assert fila.agendar(_tarefa("download", tentativa=limite_download - 1), dfe.FALHA_REDE)
+    assert fila.agendar(_tarefa("solicitacao", tentativa=limite_download), dfe.FALHA_PORTAL)
+    assert not fila.agendar(_tarefa("solicitacao", tentativa=dfe.MAX_TENTATIVAS), dfe.FALHA_PORTAL)
+
+
+def test_pendente_e_prazo_da_empresa(fila, monkeypatch):
+    monkeypatch.setattr(dfe.random, "uniform", lambda a, b: 1.0)
+    assert fila.prazo_empresa(EMPRESA_A) is None
+
+    fila.agendar(_tarefa(tipo="NFe"), dfe.FALHA_CAPTCHA)
+    fila.agendar(_tarefa(tipo="CTe"), dfe.FALHA_REDE)
+    fila.agendar(_tarefa(tipo="NFe", cert_row=EMPRESA_B), dfe.FALHA_PORTAL)
+
+    assert fila.pendente(EMPRESA_A, "202405", "solicitacao", "NFe")
+    assert not fila.pendente(EMPRESA_A, "202405", "download", "NFe")
+    assert not fila.pendente(EMPRESA_A, "202404", "solicitacao", "NFe")
+    prazo_a = fila.prazo_empresa(EMPRESA_A)
+    assert prazo_a == max(q for q, _s, t in fila._heap if t["cert_row"] is EMPRESA_A)
+    assert prazo_a - time.time() > dfe.ESPERA_BASE_FALHA[dfe.FALHA_REDE] - 1
+
+    # esgotar a tarefa tira a empresa da fila para aquela unidade
+    fila.agendar(_tarefa(tipo="CTe", tentativa=dfe.MAX_TENTATIVAS), dfe.FALHA_REDE)
+    assert not fila.pendente(EMPRESA_A, "202405", "solicitacao", "CTe")
+    assert fila.prazo_empresa(EMPRESA_A) < prazo_a
+
+
+def test_aguardar_drena_as_retentativas(monkeypatch):
+    monkeypatch.setitem(dfe.ESPERA_BASE_FALHA, dfe.FALHA_CAPTCHA, 0.01)
+    monkeypatch.setattr(dfe.POOL_SESSOES, "obter", lambda cert_row: None)
+    feitas = []
+    monkeypatch.setattr(dfe, "tentar_solicitacao", lambda s, tipo, *a: feitas.append(tipo))
+
+    fila = dfe.FilaRetentativas(max_workers=2)
+    fila.agendar(_tarefa(tipo="NFe"), dfe.FALHA_CAPTCHA)
+    fila.agendar(_tarefa(tipo="CTe"), dfe.FALHA_CAPTCHA)
+    assert fila.aguardar(5) == 0
+    assert sorted(feitas) == ["CTe", "NFe"]
+    assert fila.prazo_empresa(EMPRESA_A) is None
+
+
+def test_aguardar_avisa_as_abandonadas(monkeypatch, caplog):
+    fila = dfe.FilaRetentativas(max_workers=1)
+    fila.agendar(_tarefa(), dfe.FALHA_REDE)  # 30 s ou mais
+    inicio = time.perf_counter()
+    assert fila.aguardar(0.05) == 1
+    assert time.perf_counter() - inicio < 2
+    assert "1 retentativa(s) pendente(s) abandonada(s)" in caplog.text